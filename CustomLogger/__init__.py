@@ -1,36 +1,51 @@
+import atexit
 import logging
-from CustomLogger.customformatter import CustomFormatter, FORMAT
-from CustomLogger.customhandlers import TimedFileHandler, get_path
+import queue
+from CustomLogger.customformatter import CustomFormatter
+from CustomLogger.customhandlers import TimedFileHandler, BatchingQueueListener, DeferredQueueHandler, \
+    create_file_handler, get_path
 
 
 def getLogger(name: str = "",
               level: int = 20,
-              log_path: str = "./log/") -> logging.Logger:
+              log_path: str = "./log/",
+              queued: bool = False,
+              batch_size: int = 100) -> logging.Logger:
+    """Logger writing to the console and a daily log file.
+
+    With 'queued' the calling thread only enqueues records, a listener thread
+    formats and writes them in batches of up to 'batch_size'.
+    """
     # create logger
     logger = logging.getLogger(name)
+    logger.setLevel(level)
 
     # create console handler and set Formatter
     ch = logging.StreamHandler()
     ch.setFormatter(CustomFormatter())
+    ch.setLevel(level)
+
+    if queued:
+        record_queue = queue.SimpleQueue()
+        listener = BatchingQueueListener(record_queue, logger.name, log_path, [ch], level, batch_size)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(DeferredQueueHandler(record_queue))
+        logger.info(f"Logger started. Write Logfile to: {listener.file_path}")
+        return logger
 
     # create directory if not exists
     file_path = get_path(logger.name, log_path)
 
     # create file handler and set Formatter
-    fh = logging.FileHandler(file_path)
-    fh.setFormatter(logging.Formatter(FORMAT, "%d.%m.%Y %H:%M:%S"))
+    fh = create_file_handler(file_path, level)
 
     # add Handler
     logger.addHandler(ch)
     logger.addHandler(fh)
 
-    # setting logging level
-    logger.setLevel(level)
-    fh.setLevel(level)
-    ch.setLevel(level)
-
     # Thread to change Logfile Name at Midnight
-    TimedFileHandler(logger, log_path)
+    TimedFileHandler(logger, log_path, fh)
 
     logger.info(f"Logger started. Write Logfile to: {file_path}")
     return logger
@@ -1,6 +1,7 @@
 import logging
 
 FORMAT = "%(asctime)s.%(msecs)03d - %(name)s - %(module)s - %(funcName)s - %(lineno)d - %(levelname)s - %(message)s"
+DATEFMT = "%d.%m.%Y %H:%M:%S"
 
 
 class CustomFormatter(logging.Formatter):
@@ -23,7 +24,11 @@ class CustomFormatter(logging.Formatter):
         logging.NOTSET: MAGENTA + FORMAT + RESET
     }
 
+    def __init__(self):
+        super(CustomFormatter, self).__init__(FORMAT, DATEFMT)
+        # one formatter per level, built once
+        self.formatters = {level: logging.Formatter(log_format, DATEFMT) for level, log_format in self.FORMATS.items()}
+
     def format(self, record):
-        log_format = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_format, "%d.%m.%Y %H:%M:%S")
+        formatter = self.formatters.get(record.levelno) or self.formatters[logging.NOTSET]
         return formatter.format(record)
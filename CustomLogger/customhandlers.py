@@ -1,11 +1,13 @@
 import datetime
 import logging.handlers
 import os
+import queue
 import sys
 import time
 from threading import Thread
 from datetime import datetime, timedelta
-from CustomLogger.customformatter import FORMAT
+from typing import List
+from CustomLogger.customformatter import FORMAT, DATEFMT
 
 
 def get_path(name: str, log_path: str) -> str:
@@ -16,13 +18,26 @@ def get_path(name: str, log_path: str) -> str:
     return os.path.join(log_path, f"{timestamp}_{name}.log")
 
 
+def next_midnight(current_time: datetime) -> datetime:
+    next_day = current_time + timedelta(days=1)
+    return datetime(next_day.year, next_day.month, next_day.day)
+
+
+def create_file_handler(file_path: str, level: int) -> logging.FileHandler:
+    fh = logging.FileHandler(file_path)
+    fh.setFormatter(logging.Formatter(FORMAT, DATEFMT))
+    fh.setLevel(level)
+    return fh
+
+
 class TimedFileHandler(Thread):
-    def __init__(self, logger: logging.Logger, log_path: str):
+    def __init__(self, logger: logging.Logger, log_path: str, file_handler: logging.FileHandler):
         super(TimedFileHandler, self).__init__()
         self.daemon = True
 
         self.logger = logger
         self.log_path = log_path
+        self.file_handler = file_handler
         self.last_rollover: datetime = datetime.now()
         self.min_sleep: int = 1
         self.max_sleep: int = 60
@@ -31,8 +46,7 @@ class TimedFileHandler(Thread):
 
     @property
     def next_rollover(self) -> datetime:
-        next_day = self.last_rollover + timedelta(days=1)
-        return datetime(next_day.year, next_day.month, next_day.day)
+        return next_midnight(self.last_rollover)
 
     def calc_sleep(self, current_time: datetime) -> int:
         return min(self.max_sleep, max(self.min_sleep, (self.next_rollover - current_time + timedelta(seconds=1)).seconds))
@@ -46,13 +60,107 @@ class TimedFileHandler(Thread):
     def do_rollover(self) -> None:
         file_path = get_path(self.logger.name, self.log_path)
         self.logger.debug(f"Change Logfile path to: '{file_path}'")
-        fh = logging.FileHandler(file_path)
-        fh.setFormatter(logging.Formatter(FORMAT, "%d.%m.%Y %H:%M:%S"))
+        fh = create_file_handler(file_path, self.file_handler.level)
         self.logger.addHandler(fh)
-        self.logger.removeHandler(self.logger.handlers[-2])
+        # swap the handler this thread created, not whatever sits at some index of the logger
+        self.logger.removeHandler(self.file_handler)
+        self.file_handler.close()
+        self.file_handler = fh
         self.last_rollover: datetime = datetime.now()
 
     def run(self) -> None:
         while True:
             self.sleep()
             self.do_rollover()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record untouched, formatting is left to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class BatchingQueueListener(Thread):
+    """Take records from the queue and format and write them in batches.
+
+    The listener owns the console and the file handler, so the rollover to a
+    new log file at midnight happens between two batches and never races
+    with a write.
+    """
+    _STOP = None
+
+    def __init__(self,
+                 record_queue: queue.SimpleQueue,
+                 name: str,
+                 log_path: str,
+                 handlers: List[logging.Handler],
+                 level: int = 20,
+                 batch_size: int = 100):
+        super(BatchingQueueListener, self).__init__()
+        self.daemon = True
+
+        self.queue = record_queue
+        self.name_prefix = name
+        self.log_path = log_path
+        self.level = level
+        self.batch_size = batch_size
+        self.handlers = handlers
+        self.file_path = get_path(name, log_path)
+        self.file_handler = create_file_handler(self.file_path, level)
+        self.next_rollover: datetime = next_midnight(datetime.now())
+
+    def do_rollover(self) -> None:
+        self.file_handler.close()
+        self.file_path = get_path(self.name_prefix, self.log_path)
+        self.file_handler = create_file_handler(self.file_path, self.level)
+        self.next_rollover = next_midnight(datetime.now())
+
+    def next_batch(self) -> List[logging.LogRecord]:
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def write(handler: logging.StreamHandler, batch: List[logging.LogRecord]) -> None:
+        lines = []
+        for record in batch:
+            if record.levelno < handler.level:
+                continue
+            try:
+                lines.append(handler.format(record))
+            except Exception:
+                handler.handleError(record)
+        if not lines:
+            return
+        with handler.lock:
+            try:
+                handler.stream.write(handler.terminator.join(lines) + handler.terminator)
+                handler.flush()
+            except Exception:
+                handler.handleError(batch[-1])
+
+    def run(self) -> None:
+        while True:
+            batch = self.next_batch()
+            stop = batch[-1] is self._STOP
+            if stop:
+                batch.pop()
+            if datetime.now() >= self.next_rollover:
+                self.do_rollover()
+            for handler in self.handlers + [self.file_handler]:
+                self.write(handler, batch)
+            if stop:
+                break
+        self.file_handler.close()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Write what is queued and stop."""
+        if not self.is_alive():
+            return
+        self.queue.put(self._STOP)
+        self.join(timeout)
@@ -2,9 +2,22 @@ import threading
 import queue
 import time
 import logging
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict
+
+from Eventhandler.async_handler import AsyncBridge
+
+__all__ = ["BasicHandler", "ThreadHandler", "SubscriberStats", "AsyncBridge", "DROP_OLDEST", "BLOCK"]
 
 log = logging.getLogger(__name__)
 
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+_STOP = object()
+
 
 class BasicHandler:
     def __init__(self):
@@ -20,31 +33,200 @@ class BasicHandler:
         self.subscribers.append(fn)
 
 
+@dataclass
+class SubscriberStats:
+    calls: int = 0
+    failures: int = 0
+    dropped: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_exception: Exception = None
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.calls if self.calls else 0.0
+
+
+class _Subscriber:
+    """Events waiting for one subscriber and whether a worker is delivering them."""
+    __slots__ = ("fn", "pending", "running")
+
+    def __init__(self, fn: Callable, max_pending: int):
+        self.fn = fn
+        self.pending: Deque[tuple] = deque(maxlen=max_pending)
+        self.running: bool = False
+
+
 class ThreadHandler(threading.Thread):
-    def __init__(self):
+    """Dispatch queued events to all subscribers.
+
+    This thread only hands every event to the subscribers' own bounded
+    queues; a worker of the executor drains each subscriber's queue with
+    at most one call in flight per subscriber. A slow subscriber thus only
+    delays its own events, once its queue is full its oldest event is
+    dropped. Pass one executor to several handlers to share its threads,
+    otherwise the handler uses a pool of 'max_workers' threads.
+
+    The input queue is bounded, a full queue either drops the oldest event
+    (policy DROP_OLDEST) or blocks the caller of fire_event (policy BLOCK).
+    AsyncBridges attached with attach_bridge get every event straight from
+    fire_event, no thread subscriber can delay them.
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 max_queue: int = 100,
+                 policy: str = DROP_OLDEST,
+                 put_timeout: float = None,
+                 executor: Executor = None,
+                 subscriber_queue: int = None):
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown queue policy '{policy}'.")
         self.subscribers = []
-        self.input_queue = queue.Queue()
+        self.stats: Dict[Callable, SubscriberStats] = {}
+        self.queues: Dict[Callable, _Subscriber] = {}
+        self.bridges = []
+        self.input_queue = queue.Queue(maxsize=max_queue)
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.max_workers = max_workers
+        self.subscriber_queue = subscriber_queue or max_queue
+        self.executor = executor
+        self.dropped: int = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.stopping = threading.Event()
 
         threading.Thread.__init__(self)
         self.daemon = True
         self.exception = None
 
+    @property
+    def queue_depth(self) -> int:
+        with self.lock:
+            pending = max((len(subscriber.pending) for subscriber in self.queues.values()), default=0)
+        return self.input_queue.qsize() + pending
+
     def fire_event(self, *args) -> None:
+        if self.stopping.is_set():
+            log.debug(f"Handler is stopping, ignore Event with args {args}.")
+            return
+        for bridge in self.bridges:
+            bridge.publish(*args)
         log.debug(f"Put Event with args {args} to Queue.")
-        self.input_queue.put(args)
+        if self.policy == BLOCK:
+            self.input_queue.put(args, timeout=self.put_timeout)
+            return
+        while True:
+            try:
+                self.input_queue.put_nowait(args)
+                return
+            except queue.Full:
+                try:
+                    self.input_queue.get_nowait()
+                    self.input_queue.task_done()
+                    self.dropped += 1
+                    log.warning(f"Event queue full, dropped oldest event. Dropped in total: '{self.dropped}'")
+                except queue.Empty:
+                    pass
 
     def subscribe(self, fn) -> None:
         log.debug(f"Add Function {fn} to subscribers")
-        self.subscribers.append(fn)
+        with self.lock:
+            self.stats[fn] = SubscriberStats()
+            self.queues[fn] = _Subscriber(fn, self.subscriber_queue)
+            self.subscribers.append(fn)
+
+    def attach_bridge(self, bridge: AsyncBridge) -> None:
+        """Publish every event to the bridge from fire_event, bypassing the thread subscribers."""
+        self.bridges.append(bridge)
+
+    def _call(self, fn, args: tuple) -> None:
+        start = time.perf_counter()
+        exception = None
+        try:
+            fn(*args)
+        except Exception as e:
+            exception = e
+            log.exception(f"Subscriber {fn} failed: {e}")
+        latency = time.perf_counter() - start
+        with self.lock:
+            stats = self.stats[fn]
+            stats.calls += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if exception is not None:
+                stats.failures += 1
+                stats.last_exception = exception
+
+    def _drain(self, subscriber: _Subscriber) -> None:
+        """Deliver the subscriber's events until its queue is empty, runs on an executor worker."""
+        while True:
+            with self.lock:
+                if not subscriber.pending:
+                    subscriber.running = False
+                    self.idle.notify_all()
+                    return
+                args = subscriber.pending.popleft()
+            self._call(subscriber.fn, args)
+
+    def _dispatch(self, executor: Executor, args: tuple) -> None:
+        with self.lock:
+            subscribers = list(self.queues.values())
+            for subscriber in subscribers:
+                if len(subscriber.pending) == subscriber.pending.maxlen:
+                    # the deque drops its oldest entry on append
+                    self.stats[subscriber.fn].dropped += 1
+                    self.dropped += 1
+                    log.warning(f"Subscriber {subscriber.fn} too slow, dropped its oldest event. "
+                                f"Dropped in total: '{self.dropped}'")
+                subscriber.pending.append(args)
+            idle = [subscriber for subscriber in subscribers if not subscriber.running]
+            for subscriber in idle:
+                subscriber.running = True
+        for subscriber in idle:
+            executor.submit(self._drain, subscriber)
+
+    def _next_event(self):
+        """Next queued event, None once stopping and the queue is drained."""
+        try:
+            # the stop marker may not have fit into a full queue, do not wait past the last event then
+            return self.input_queue.get(timeout=0.1 if self.stopping.is_set() else None)
+        except queue.Empty:
+            return None
 
     def run(self) -> None:
         log.debug("Start Eventhandler Thread")
-        while True:
-            if self.input_queue.empty():
-                time.sleep(1)
-                log.debug("No data in Queue.")
-                continue
-            args = self.input_queue.get()
-            log.debug(f"Got {args} from Queue.")
-            for fn in self.subscribers:
-                fn(*args)
+        own_executor = None
+        executor = self.executor
+        if executor is None:
+            executor = own_executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="event")
+        try:
+            while True:
+                args = self._next_event()
+                if args is _STOP:
+                    self.input_queue.task_done()
+                    break
+                if args is None:
+                    break
+                log.debug(f"Got {args} from Queue.")
+                self._dispatch(executor, args)
+                self.input_queue.task_done()
+            # deliver what the subscribers still have queued
+            with self.idle:
+                self.idle.wait_for(lambda: not any(subscriber.running for subscriber in self.queues.values()))
+        finally:
+            if own_executor is not None:
+                own_executor.shutdown(wait=False)
+        log.debug("Eventhandler Thread stopped")
+
+    def stop(self, timeout: float = None) -> None:
+        """Handle all queued events, then stop the thread. Waits at most 'timeout' seconds."""
+        self.stopping.set()
+        if not self.is_alive():
+            return
+        try:
+            self.input_queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        self.join(timeout)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Callable, Dict, List, Set
+
+log = logging.getLogger(__name__)
+
+
+class AsyncBridge:
+    """Hand events fired on handler threads over to asyncio consumers.
+
+    Every consumer awaits its own asyncio.Queue, so idle consumers cost
+    nothing. Each event needs one call_soon_threadsafe per event loop,
+    the fan out to the queues of that loop then runs inside the loop.
+    """
+
+    def __init__(self, maxsize: int = 100):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.queues: Dict[asyncio.AbstractEventLoop, Set[asyncio.Queue]] = {}
+        self.coroutines: Dict[asyncio.AbstractEventLoop, List[Callable]] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def attach(self, handler) -> None:
+        """Receive the handler's events as they are fired, ahead of its thread subscribers if it supports that."""
+        if hasattr(handler, "attach_bridge"):
+            handler.attach_bridge(self)
+        else:
+            handler.subscribe(self.publish)
+
+    def publish(self, *args) -> None:
+        """Schedule the event in every consumer loop, called from any thread; never blocks."""
+        with self.lock:
+            loops = set(self.queues) | set(self.coroutines)
+        for loop in loops:
+            if loop.is_closed():
+                self._remove_loop(loop)
+                continue
+            try:
+                loop.call_soon_threadsafe(self._fan_out, loop, args)
+            except RuntimeError:
+                # closed between the check and the call
+                self._remove_loop(loop)
+
+    def _remove_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self.lock:
+            self.queues.pop(loop, None)
+            self.coroutines.pop(loop, None)
+
+    def _fan_out(self, loop: asyncio.AbstractEventLoop, args: tuple) -> None:
+        with self.lock:
+            queues = list(self.queues.get(loop, ()))
+            coroutines = list(self.coroutines.get(loop, ()))
+        for consumer in queues:
+            if consumer.full():
+                consumer.get_nowait()
+                log.warning("Async consumer too slow, dropped oldest event.")
+            consumer.put_nowait(args)
+        for coroutine in coroutines:
+            task = loop.create_task(coroutine(*args))
+            self.tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error(f"Async subscriber failed: {task.exception()}", exc_info=task.exception())
+
+    def subscribe(self, coroutine: Callable, loop: asyncio.AbstractEventLoop = None) -> None:
+        """Run coroutine(*args) as a task in loop (default: the running loop) for every event."""
+        loop = loop or asyncio.get_running_loop()
+        with self.lock:
+            self.coroutines.setdefault(loop, []).append(coroutine)
+
+    def queue(self) -> asyncio.Queue:
+        """New queue receiving every event, must be called inside the consuming event loop."""
+        loop = asyncio.get_running_loop()
+        consumer = asyncio.Queue(maxsize=self.maxsize)
+        with self.lock:
+            self.queues.setdefault(loop, set()).add(consumer)
+        return consumer
+
+    def remove_queue(self, consumer: asyncio.Queue) -> None:
+        with self.lock:
+            for queues in self.queues.values():
+                queues.discard(consumer)
+
+    async def events(self) -> AsyncIterator:
+        consumer = self.queue()
+        try:
+            while True:
+                args = await consumer.get()
+                yield args[0] if len(args) == 1 else args
+        finally:
+            self.remove_queue(consumer)
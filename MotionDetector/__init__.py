@@ -1,14 +1,17 @@
+import asyncio
 import logging
 import queue
 import threading
+from typing import AsyncIterator, Callable, List, Tuple
 
-import Eventhandler
-from MotionDetector.buffer_frame import FrameBuffer
-from MotionDetector.item_image import ImageItem
+from numpy import ndarray
+
+from MotionDetector.item_image import ImageItem, EMPTY
 from MotionDetector.capture import StreamReader
-from MotionDetector.preprocessor import PreProcessor
-from MotionDetector.contours import ContourProcessor
-from MotionDetector.buffer_motion import MotionBuffer, MotionFlag
+from MotionDetector.buffer_motion import MotionBuffer
+from MotionDetector.camera import Camera, CameraConfig
+from MotionDetector.event_store import EventRecord
+from MotionDetector.supervisor import MotionSupervisor
 from src.lib_path import get_path
 
 log = logging.getLogger(__name__)
@@ -18,70 +21,109 @@ class MotionDetector(threading.Thread):
     def __init__(self,
                  url: str,
                  min_area_ratio: float = 2.0,
-                 max_area_ratio: float = 10.0):
+                 max_area_ratio: float = 10.0,
+                 max_fps: float = 1.0,
+                 active_fps: float = None,
+                 threaded_capture: bool = False,
+                 backend: str = "thread",
+                 record_dir: str = None,
+                 event_db: str = None,
+                 background_dir: str = None):
         threading.Thread.__init__(self)
         self.daemon = True
-        self.exception = None
 
         self.url = url
-        self.frame_buffer = FrameBuffer(buffer_size=30)
-        self.stream_reader = StreamReader(url=url,
-                                          buffer=self.frame_buffer,
-                                          max_fps=1.0)
         # ToDo: Define Threshold for motion detection
-        self.preprocessor = PreProcessor(scale=0.3,
-                                         sub_threshold=80,
-                                         mask_path=get_path("./data/mask.png"))
-        self.contour_processor = ContourProcessor(min_area_ratio=min_area_ratio,
-                                                  max_area_ratio=max_area_ratio)
-        self.motion_buffer = MotionBuffer(buffer_size=2)
-
-        self.motion_start_handler = Eventhandler.ThreadHandler()
-        self.motion_end_handler = Eventhandler.ThreadHandler()
+        config = CameraConfig(url=url,
+                              mask_path=get_path("./data/mask.png"),
+                              scale=0.3,
+                              sub_threshold=80,
+                              min_area_ratio=min_area_ratio,
+                              max_area_ratio=max_area_ratio,
+                              max_fps=max_fps,
+                              active_fps=active_fps,
+                              buffer_size=30,
+                              threaded_capture=threaded_capture,
+                              record_dir=record_dir,
+                              background_dir=background_dir)
+        self.supervisor = MotionSupervisor([config], max_workers=1, backend=backend, event_db=event_db)
+        self.camera: Camera = self.supervisor.cameras[0]
+        self.camera.connect()
+
+        self.frame_buffer = self.camera.frame_buffer
+        self.preprocessor = self.camera.preprocessor
+        self.contour_processor = self.camera.contour_processor
+        self.motion_start_handler = self.camera.motion_start_handler
+        self.motion_end_handler = self.camera.motion_end_handler
+        self.event_store = self.supervisor.event_store
 
         self.output_queue = queue.Queue()
 
     def __del__(self):
-        self.stream_reader.disconnect()
+        self.camera.disconnect()
+
+    @property
+    def stream_reader(self) -> StreamReader:
+        return self.camera.stream_reader
+
+    @property
+    def motion_buffer(self) -> MotionBuffer:
+        return self.camera.motion_buffer
+
+    def get_skipped_frames(self) -> int:
+        return self.stream_reader.skipped_frames if self.stream_reader else 0
+
+    def get_stream_state(self) -> str:
+        """'up' or 'down' while the stream reconnects in the background."""
+        return self.camera.stream_state
+
+    def get_heatmap(self) -> ndarray:
+        """Decayed seconds of motion per cell of the low resolution heatmap."""
+        return self.camera.heatmap.heatmap()
+
+    def get_activity(self, since: float = None) -> List[Tuple[float, float]]:
+        """(minute start as epoch seconds, seconds of motion) since the given epoch time."""
+        return self.camera.heatmap.activity_index(since)
+
+    def query_events(self, start: float = None, end: float = None, limit: int = None) -> List[EventRecord]:
+        """Stored motion events that started in [start, end) as epoch seconds."""
+        if self.event_store is None:
+            raise RuntimeError("No event store, pass 'event_db' to record events.")
+        return self.event_store.query(camera=self.camera.name, start=start, end=end, limit=limit)
+
+    def reconfigure(self, **changes) -> None:
+        """Change mask_path, sub_threshold, min/max_area_ratio or morphology without a restart."""
+        self.camera.reconfigure(**changes)
+
+    def get_fps(self) -> float:
+        return self.camera.stats.current_fps
+
+    def get_metrics(self) -> dict:
+        return self.camera.metrics.snapshot()
 
     def get_frame(self):
-        return self.stream_reader.get_frame()
+        return self.camera.get_frame()
 
     def motion_trigger(self) -> ImageItem:
         if self.output_queue.empty():
-            return ImageItem()
+            return EMPTY
         image_item = self.output_queue.get()
         self.output_queue.task_done()
         return image_item
 
+    def events(self) -> AsyncIterator[ImageItem]:
+        """Async iterator over motion start and end events, check ImageItem.motion_status for the kind."""
+        return self.camera.get_async_bridge().events()
+
+    def subscribe_async(self, coroutine: Callable, loop: asyncio.AbstractEventLoop = None) -> None:
+        """Run coroutine(image_item) in loop (default: the running loop) for every motion start and end event."""
+        self.camera.get_async_bridge().subscribe(coroutine, loop)
+
     def run(self) -> None:
-        # Start threaded Handler
-        self.motion_start_handler.start()
-        self.motion_end_handler.start()
-
-        while True:
-            try:
-                frame = self.stream_reader.capture()
-                image_item = self.preprocessor.preprocess_image(frame)
-                self.contour_processor.find_contours(image_item)
-
-                image_item.motion_status = self.motion_buffer.get_motion(image_item.has_contours)
-                if image_item.motion_status == MotionFlag.MotionStart:
-                    image_item.frames = self.frame_buffer.get_frames()
-                    self.motion_start_handler.fire_event(image_item)
-
-                elif image_item.motion_status == MotionFlag.MotionEnd:
-                    image_item.frames = self.frame_buffer.get_frames()
-                    self.motion_end_handler.fire_event(image_item)
-
-            except KeyboardInterrupt as e:
-                self.exception = e
-                log.exception(e)
-                break
-            except Exception as e:
-                self.exception = e
-                log.exception(e)
-                break
+        self.supervisor.run()
+
+    def stop(self) -> None:
+        self.supervisor.stop()
 
     def get_exception(self) -> Exception:
-        return self.exception
+        return self.supervisor.exception
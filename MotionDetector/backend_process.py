@@ -0,0 +1,327 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from dataclasses import dataclass, field, replace
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+from numpy import ndarray, uint8, copyto, prod
+
+from MotionDetector.buffer_motion import MotionFlag
+from MotionDetector.item_contours import ContourSet
+from MotionDetector.item_image import ImageItem
+
+if TYPE_CHECKING:
+    from MotionDetector.camera import CameraConfig
+
+log = logging.getLogger(__name__)
+
+
+class SharedFrameRing:
+    """Fixed number of frame slots in one shared memory block."""
+
+    def __init__(self, shape: Tuple[int, ...], slots: int = 2, name: str = None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.index = 0
+        size = int(slots * prod(self.shape))
+        self.shm = SharedMemory(name=name, create=name is None, size=size)
+        self.array = ndarray((slots,) + self.shape, dtype=uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, frame: ndarray) -> int:
+        slot = self.index
+        copyto(self.array[slot], frame)
+        self.index = (slot + 1) % self.slots
+        return slot
+
+    def read(self, slot: int) -> ndarray:
+        return self.array[slot]
+
+    def close(self) -> None:
+        self.array = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        self.close()
+        self.shm.unlink()
+
+
+@dataclass
+class DetectionJob:
+    job_id: int
+    camera_name: str
+    ring_name: str
+    shape: Tuple[int, ...]
+    slot: int
+    warmup: bool = False
+
+
+@dataclass
+class DetectionResult:
+    """What the worker sends back for a frame: the detection and the worker-side state the parent mirrors.
+
+    The preprocessed frames (dilated_frame etc.) stay in the worker, consumers
+    of the mask fall back to the contour boxes.
+    """
+    job_id: int
+    motion_status: MotionFlag = MotionFlag.NoMotion
+    contour_set: ContourSet = field(default_factory=ContourSet)
+    gated: bool = False
+    frame_area: int = 0
+    roi_offset: Tuple[int, int] = (0, 0)
+    motion_flag: bool = False
+    motion_window: List[bool] = field(default_factory=list)
+    frames_gated: int = 0
+    frames_processed: int = 0
+    error: str = ""
+
+
+def _worker(inbox: multiprocessing.Queue, outbox: multiprocessing.Queue) -> None:
+    from MotionDetector.detector import Detector
+
+    cameras: Dict[str, Detector] = {}
+    rings: Dict[str, SharedFrameRing] = {}
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        command, payload = message
+        if command == "configure":
+            camera = cameras[payload.name or payload.url] = Detector(payload)
+            camera.load_background()
+            continue
+        if command == "checkpoint":
+            if payload in cameras:
+                cameras[payload].save_background()
+            continue
+        if command == "reconfigure":
+            camera_name, changes = payload
+            if camera_name in cameras:
+                cameras[camera_name].apply_changes(changes)
+            continue
+        if command == "reset":
+            camera = cameras.get(payload)
+            if camera is not None:
+                cameras[payload] = Detector(camera.config)
+            continue
+
+        job: DetectionJob = payload
+        try:
+            ring = rings.get(job.camera_name)
+            if ring is None or ring.name != job.ring_name:
+                if ring is not None:
+                    ring.close()
+                ring = SharedFrameRing(job.shape, name=job.ring_name)
+                rings[job.camera_name] = ring
+            detector = cameras[job.camera_name]
+            if job.warmup:
+                detector.warm_up(ring.read(job.slot))
+                outbox.put(DetectionResult(job_id=job.job_id))
+                continue
+            image_item = detector.detect(ring.read(job.slot))
+            outbox.put(DetectionResult(job_id=job.job_id,
+                                       motion_status=image_item.motion_status,
+                                       contour_set=image_item.contour_set,
+                                       gated=image_item.gated,
+                                       frame_area=image_item.frame_area,
+                                       roi_offset=image_item.roi_offset,
+                                       motion_flag=detector.motion_buffer.motion_flag,
+                                       motion_window=list(detector.motion_buffer.buffer),
+                                       frames_gated=detector.preprocessor.frames_gated,
+                                       frames_processed=detector.preprocessor.frames_processed))
+        except Exception as e:
+            outbox.put(DetectionResult(job_id=job.job_id, error=f"{type(e).__name__}: {e}"))
+
+    for ring in rings.values():
+        ring.close()
+
+
+class ProcessBackend:
+    """Run preprocess, contour and motion detection of each camera in a pinned worker process.
+
+    Frames are handed over through shared memory slots, only the contours and
+    the motion flag are sent back to the parent. A worker that dies fails the
+    jobs it held and is restarted with its cameras; their background models
+    start over from the last checkpoint.
+    """
+
+    def __init__(self,
+                 processes: int = None,
+                 slots: int = 2,
+                 result_timeout: float = 10.0,
+                 check_interval: float = 1.0):
+        self.processes = processes or os.cpu_count() or 1
+        self.slots = slots
+        self.result_timeout = result_timeout
+        self.check_interval = check_interval
+        self.context = multiprocessing.get_context("spawn")
+        self.outbox = self.context.Queue()
+        self.inboxes = [self.context.Queue() for _ in range(self.processes)]
+        self.workers = [self._process(inbox) for inbox in self.inboxes]
+
+        self.assignment: Dict[str, int] = {}
+        # configuration of every camera as its worker holds it, to configure a restarted worker
+        self.configs: Dict[str, "CameraConfig"] = {}
+        self.rings: Dict[str, SharedFrameRing] = {}
+        self.pending: Dict[int, Tuple[Future, ndarray, int]] = {}
+        self.job_ids = itertools.count()
+        self.lock = threading.Lock()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.started: bool = False
+        self.stopping: bool = False
+
+    def _process(self, inbox: multiprocessing.Queue) -> multiprocessing.Process:
+        return self.context.Process(target=_worker, args=(inbox, self.outbox), daemon=True)
+
+    def start(self) -> None:
+        for worker in self.workers:
+            worker.start()
+        self.collector.start()
+        self.started = True
+
+    def register(self, camera) -> None:
+        with self.lock:
+            index = len(self.assignment) % self.processes
+            self.assignment[camera.name] = index
+            self.configs[camera.name] = camera.config
+        self.inboxes[index].put(("configure", camera.config))
+
+    def reset(self, camera) -> None:
+        if camera.name in self.assignment:
+            self.inboxes[self.assignment[camera.name]].put(("reset", camera.name))
+
+    def checkpoint(self, camera) -> None:
+        """Let the worker save the camera's background model, it holds the only trained one."""
+        if camera.name in self.assignment:
+            self.inboxes[self.assignment[camera.name]].put(("checkpoint", camera.name))
+
+    def reconfigure(self, camera, changes: dict) -> None:
+        """Apply the changes in the worker, queued in order with the camera's detection jobs."""
+        if camera.name in self.assignment:
+            with self.lock:
+                self.configs[camera.name] = replace(self.configs[camera.name], **changes)
+            self.inboxes[self.assignment[camera.name]].put(("reconfigure", (camera.name, changes)))
+
+    def _ring(self, camera_name: str, shape: Tuple[int, ...]) -> SharedFrameRing:
+        ring = self.rings.get(camera_name)
+        if ring is None or ring.shape != shape:
+            if ring is not None:
+                ring.unlink()
+            ring = SharedFrameRing(shape, slots=self.slots)
+            self.rings[camera_name] = ring
+        return ring
+
+    def submit(self, camera, frame: ndarray, warmup: bool = False) -> Future:
+        if camera.name not in self.assignment:
+            self.register(camera)
+        ring = self._ring(camera.name, frame.shape)
+        slot = ring.write(frame)
+        future = Future()
+        future.job_id = job_id = next(self.job_ids)
+        index = self.assignment[camera.name]
+        with self.lock:
+            self.pending[job_id] = (future, frame, index)
+            inbox = self.inboxes[index]
+        inbox.put(("detect", DetectionJob(job_id=job_id, camera_name=camera.name,
+                                          ring_name=ring.name, shape=ring.shape, slot=slot, warmup=warmup)))
+        return future
+
+    def _result(self, future: Future):
+        try:
+            return future.result(timeout=self.result_timeout)
+        except TimeoutError:
+            with self.lock:
+                self.pending.pop(future.job_id, None)
+            raise TimeoutError(f"No detection result within {self.result_timeout} seconds.")
+
+    def detect(self, camera, frame: ndarray) -> ImageItem:
+        """Detect in the worker and mirror its motion state and gate counters into the camera."""
+        image_item, result = self._result(self.submit(camera, frame))
+        camera.motion_buffer.motion_flag = result.motion_flag
+        camera.motion_buffer.buffer = result.motion_window
+        camera.preprocessor.frames_gated = result.frames_gated
+        camera.preprocessor.frames_processed = result.frames_processed
+        return image_item
+
+    def warm_up(self, camera, frame: ndarray) -> None:
+        self._result(self.submit(camera, frame, warmup=True))
+
+    def _restart(self, index: int) -> None:
+        """Fail the jobs of a dead worker and replace it with a freshly configured one."""
+        worker = self.workers[index]
+        log.error(f"Detection worker '{index}' died with exit code '{worker.exitcode}', restart it.")
+        with self.lock:
+            failed = [job_id for job_id, (_, _, worker_index) in self.pending.items() if worker_index == index]
+            futures = [self.pending.pop(job_id)[0] for job_id in failed]
+            # jobs still queued for the dead worker are lost with its inbox
+            inbox = self.inboxes[index] = self.context.Queue()
+            configs = [config for name, config in self.configs.items() if self.assignment[name] == index]
+        for future in futures:
+            future.set_exception(RuntimeError(f"Detection worker '{index}' died."))
+        for config in configs:
+            inbox.put(("configure", config))
+        self.workers[index] = self._process(inbox)
+        self.workers[index].start()
+
+    def _check_workers(self) -> None:
+        for index, worker in enumerate(self.workers):
+            if not self.stopping and not worker.is_alive():
+                self._restart(index)
+
+    def _collect(self) -> None:
+        next_check = time.monotonic() + self.check_interval
+        while True:
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + self.check_interval
+            try:
+                result: DetectionResult = self.outbox.get(timeout=self.check_interval)
+            except queue.Empty:
+                continue
+            if result is None:
+                break
+            with self.lock:
+                entry = self.pending.pop(result.job_id, None)
+            if entry is None:
+                # timed out or failed with its worker already
+                continue
+            future, frame, _ = entry
+            if result.error:
+                future.set_exception(RuntimeError(result.error))
+                continue
+            future.set_result((ImageItem(has_data=True,
+                                         gated=result.gated,
+                                         original_frame=frame,
+                                         motion_status=result.motion_status,
+                                         contour_set=result.contour_set,
+                                         roi_offset=result.roi_offset,
+                                         frame_area=result.frame_area), result))
+
+    def shutdown(self) -> None:
+        if not self.started:
+            return
+        self.stopping = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.outbox.put(None)
+        self.collector.join(timeout=5)
+        for ring in self.rings.values():
+            ring.unlink()
+        self.rings.clear()
+        with self.lock:
+            for future, _, _ in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.started = False
+        self.stopping = False
@@ -1,25 +1,70 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from typing import List
+from numpy import ndarray, empty, concatenate, copyto, uint8
 
 
 @dataclass
 class FrameBuffer:
+    """Ring buffer of frames backed by one preallocated (N, H, W, C) array."""
     buffer_size: int
-    buffer: list = field(default_factory=list)
+    buffer: ndarray = None
+    count: int = 0
 
     def __post_init__(self):
         if self.buffer_size < 1:
             raise ValueError("Buffer size must be 1 or greater.")
 
-    def __getitem__(self, item):
-        return self.buffer[item]
+    def __len__(self) -> int:
+        return min(self.count, self.buffer_size)
 
-    def get_frames(self):
-        return self.buffer
+    def __getitem__(self, item: int) -> ndarray:
+        length = len(self)
+        if not -length <= item < length:
+            raise IndexError("Frame buffer index out of range.")
+        if item < 0:
+            item += length
+        return self.buffer[(self.count - length + item) % self.buffer_size]
+
+    def _allocate(self, shape: tuple) -> None:
+        self.buffer = empty((self.buffer_size,) + tuple(shape), dtype=uint8)
+        self.count = 0
+
+    def _ordered(self) -> List[ndarray]:
+        """Oldest and newest part of the ring as at most two contiguous views."""
+        length = len(self)
+        start = (self.count - length) % self.buffer_size
+        if start + length <= self.buffer_size:
+            return [self.buffer[start:start + length]]
+        return [self.buffer[start:], self.buffer[:(start + length) % self.buffer_size]]
+
+    def get_frames(self) -> List[ndarray]:
+        """Ordered views into the ring, only valid until the slots are overwritten."""
+        if self.buffer is None:
+            return []
+        return [frame for part in self._ordered() for frame in part]
+
+    def snapshot(self) -> ndarray:
+        """Ordered copy of the buffered frames, safe to keep after the next write."""
+        if self.buffer is None or not self.count:
+            return empty((0,), dtype=uint8)
+        return concatenate(self._ordered())
 
     def buffer_full(self) -> bool:
-        return len(self.buffer) == self.buffer_size
+        return self.count >= self.buffer_size
+
+    def next_slot(self) -> ndarray:
+        """The slot written by the next commit, or None if the frame shape is not known yet."""
+        if self.buffer is None:
+            return None
+        return self.buffer[self.count % self.buffer_size]
+
+    def commit(self) -> ndarray:
+        slot = self.next_slot()
+        self.count += 1
+        return slot
 
-    def add_frame(self, frame) -> None:
-        if self.buffer_full():
-            self.buffer.pop(0)
-        self.buffer.append(frame)
+    def add_frame(self, frame: ndarray) -> ndarray:
+        if self.buffer is None or self.buffer.shape[1:] != frame.shape:
+            self._allocate(frame.shape)
+        copyto(self.next_slot(), frame)
+        return self.commit()
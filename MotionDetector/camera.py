@@ -0,0 +1,426 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import Eventhandler
+from numpy import ndarray
+from MotionDetector.buffer_frame import FrameBuffer
+from MotionDetector.item_image import ImageItem, EMPTY
+from MotionDetector.capture import StreamReader, STREAM_DOWN
+from MotionDetector.preprocessor import scaled_size
+from MotionDetector.buffer_motion import MotionBuffer, MotionFlag
+from MotionDetector.detector import Detector
+from MotionDetector.encoder import JpegEncoder
+from MotionDetector.recorder import ClipRecorder
+from MotionDetector.scheduler import AdaptiveRate, EXPONENTIAL
+from MotionDetector.metrics import Metrics
+from MotionDetector.heatmap import ActivityHeatmap, BOXES
+from MotionDetector.event_store import EventRecord, EventStore
+from MotionDetector.watcher import ConfigWatcher
+
+log = logging.getLogger(__name__)
+
+# settings Camera.reconfigure can change at runtime
+RELOADABLE = ("mask_path", "sub_threshold", "min_area_ratio", "max_area_ratio", "morphology")
+
+
+@dataclass
+class CameraConfig:
+    url: str
+    name: str = ""
+    mask_path: str = None
+    scale: float = 0.3
+    sub_threshold: int = 80
+    min_area_ratio: float = 2.0
+    max_area_ratio: float = 10.0
+    max_fps: float = 1.0
+    active_fps: float = None
+    fps_ramp_up: float = 1.0
+    fps_decay: float = 10.0
+    # decay back to max_fps, EXPONENTIAL or LINEAR from MotionDetector.scheduler
+    fps_curve: str = EXPONENTIAL
+    buffer_size: int = 30
+    threaded_capture: bool = False
+    decode_scale: float = 1.0
+    grayscale: bool = False
+    jpeg_quality: int = 95
+    record_dir: str = None
+    record_fps: float = None
+    post_roll: int = 5
+    event_workers: int = 4
+    event_queue_size: int = 100
+    debug: bool = False
+    # fraction of the 64x36 thumbnail that has to change by more than gate_pixel_threshold, None disables the gate
+    gate_threshold: float = None
+    gate_pixel_threshold: int = 10
+    background_interval: int = 10
+    open_timeout: float = 10.0
+    reconnect_delay: float = 1.0
+    reconnect_max_delay: float = 120.0
+    warmup_frames: int = 10
+    heatmap_size: Tuple[int, int] = (64, 36)
+    heatmap_half_life: float = 3600.0
+    heatmap_source: str = BOXES
+    heatmap_dir: str = None
+    heatmap_interval: float = 300.0
+    # keyword arguments of MorphologyStage
+    morphology: Dict[str, int] = None
+    # checkpoints of the learned background, a checkpoint older than background_max_age seconds is ignored
+    background_dir: str = None
+    background_checkpoint_interval: float = 600.0
+    background_max_age: float = 3600.0
+    # poll the mask and this JSON file of reloadable settings every watch_interval seconds
+    settings_path: str = None
+    watch_interval: float = None
+
+
+@dataclass
+class CameraStats:
+    frames: int = 0
+    errors: int = 0
+    restarts: int = 0
+    busy_time: float = 0.0
+    started: float = 0.0
+    current_fps: float = 0.0
+
+    @property
+    def fps(self) -> float:
+        elapsed = time.time() - self.started
+        return self.frames / elapsed if self.started and elapsed > 0 else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.busy_time / self.frames if self.frames else 0.0
+
+
+class Camera(Detector):
+    """Capture and detection state of a single stream, stepped by a MotionSupervisor."""
+
+    def __init__(self, config: CameraConfig):
+        Detector.__init__(self, config)
+        self.exception = None
+
+        self.frame_buffer = FrameBuffer(buffer_size=config.buffer_size)
+        self.stream_reader: StreamReader = None
+
+        # both handlers deliver to their subscribers on one pool
+        self.event_executor = ThreadPoolExecutor(max_workers=max(1, config.event_workers), thread_name_prefix="event")
+        self.motion_start_handler = Eventhandler.ThreadHandler(max_queue=config.event_queue_size,
+                                                               executor=self.event_executor)
+        self.motion_end_handler = Eventhandler.ThreadHandler(max_queue=config.event_queue_size,
+                                                             executor=self.event_executor)
+
+        self.encoder = JpegEncoder(quality=config.jpeg_quality)
+        self.recorder: ClipRecorder = None
+        if config.record_dir:
+            self.recorder = ClipRecorder(directory=config.record_dir,
+                                         name=config.name,
+                                         fps=config.record_fps or config.active_fps or config.max_fps,
+                                         post_roll=config.post_roll)
+        self.async_bridge: Eventhandler.AsyncBridge = None
+        self.backend = None
+        self.stats = CameraStats()
+        self.busy: bool = False
+        self.next_due: float = 0.0
+        self.last_submit: float = 0.0
+
+        # with an active rate the camera samples at max_fps while idle and speeds up on motion
+        self.rate: AdaptiveRate = None
+        if config.active_fps:
+            self.rate = AdaptiveRate(idle_fps=config.max_fps,
+                                     active_fps=config.active_fps,
+                                     ramp_up=config.fps_ramp_up,
+                                     decay=config.fps_decay,
+                                     curve=config.fps_curve)
+        self.stats.current_fps = config.max_fps
+        # frames that only feed the background model after the stream came back
+        self.warmup_remaining: int = 0
+
+        self.heatmap: ActivityHeatmap = None
+        if config.heatmap_size:
+            self.heatmap = ActivityHeatmap(size=config.heatmap_size,
+                                           half_life=config.heatmap_half_life,
+                                           source=config.heatmap_source)
+        self.last_heatmap_save: float = time.monotonic()
+        self.last_background_save: float = time.monotonic()
+
+        # the motion event in progress, written to the event store if there is one
+        self.event: EventRecord = None
+        self.event_store: EventStore = None
+
+        # settings queued by reconfigure, applied by the thread stepping the camera before the next frame
+        self.pending_changes: dict = {}
+        self.changes_lock = threading.Lock()
+        self.watcher: ConfigWatcher = None
+        if config.watch_interval:
+            self.watcher = ConfigWatcher(self, settings_path=config.settings_path, interval=config.watch_interval)
+
+    def set_backend(self, backend) -> None:
+        """Detect in a ProcessBackend; its items carry no dilated_frame, the heatmap then uses the contour boxes."""
+        self.backend = backend
+        if backend is not None and self.heatmap is not None and self.heatmap.source != BOXES:
+            log.warning(f"Heatmap of camera '{self.name}' uses contour boxes, "
+                        f"the foreground mask stays in the detection worker.")
+            self.heatmap.source = BOXES
+
+    def set_metrics(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+        self.preprocessor.metrics = metrics
+        metrics.gauge("frames_dropped", lambda: self.stream_reader.skipped_frames if self.stream_reader else 0)
+        metrics.gauge("reconnects", lambda: self.stream_reader.reconnects if self.stream_reader else 0)
+        metrics.gauge("stream_up", lambda: int(self.stream_state != STREAM_DOWN))
+        metrics.gauge("frames_gated", lambda: self.preprocessor.frames_gated)
+        metrics.gauge("restarts", lambda: self.stats.restarts)
+        metrics.gauge("errors", lambda: self.stats.errors)
+        metrics.gauge("current_fps", lambda: self.stats.current_fps)
+        metrics.gauge("start_queue_depth", lambda: self.motion_start_handler.queue_depth)
+        metrics.gauge("end_queue_depth", lambda: self.motion_end_handler.queue_depth)
+        metrics.gauge("events_dropped",
+                      lambda: self.motion_start_handler.dropped + self.motion_end_handler.dropped)
+        if self.recorder is not None:
+            metrics.gauge("recorder_queue_depth", lambda: self.recorder.input_queue.qsize())
+
+    @property
+    def heatmap_path(self) -> str:
+        return self.state_path(self.config.heatmap_dir, "heatmap") if self.heatmap is not None else ""
+
+    def save_background(self) -> None:
+        """Checkpoint the background model, in the worker process with the process backend."""
+        if self.background_path:
+            if self.backend is not None:
+                self.backend.checkpoint(self)
+            else:
+                Detector.save_background(self)
+        self.last_background_save = time.monotonic()
+
+    def save_state(self) -> None:
+        self.save_heatmap()
+        self.save_background()
+
+    def load_heatmap(self) -> None:
+        if self.heatmap_path and os.path.exists(self.heatmap_path):
+            self.heatmap.restore(self.heatmap_path)
+
+    def save_heatmap(self) -> None:
+        if self.heatmap_path:
+            self.heatmap.save(self.heatmap_path)
+        self.last_heatmap_save = time.monotonic()
+
+    def start_handlers(self) -> None:
+        self.load_heatmap()
+        if self.backend is None:
+            self.load_background()
+        self.motion_start_handler.start()
+        self.motion_end_handler.start()
+        if self.recorder is not None:
+            self.recorder.start()
+        if self.watcher is not None:
+            self.watcher.start()
+        self.stats.started = time.time()
+
+    def stop_handlers(self, timeout: float = None) -> None:
+        self.motion_start_handler.stop(timeout)
+        self.motion_end_handler.stop(timeout)
+        if not self.motion_start_handler.is_alive() and not self.motion_end_handler.is_alive():
+            self.event_executor.shutdown(wait=False)
+        if self.recorder is not None:
+            self.recorder.stop(timeout)
+        if self.watcher is not None:
+            self.watcher.stop()
+
+    def reconfigure(self, **changes) -> None:
+        """Queue new settings, they are applied together between two frames. ValueError if they are invalid."""
+        unknown = set(changes) - set(RELOADABLE)
+        if unknown:
+            raise ValueError(f"Cannot reload '{sorted(unknown)}', reloadable are '{RELOADABLE}'.")
+        with self.changes_lock:
+            pending = {**self.pending_changes, **changes}
+            self.check_changes(pending)
+            self.pending_changes = pending
+
+    def apply_pending_changes(self) -> None:
+        with self.changes_lock:
+            changes, self.pending_changes = self.pending_changes, {}
+        if changes:
+            self.apply_changes(changes)
+
+    def apply_changes(self, changes: dict) -> dict:
+        changes = Detector.apply_changes(self, changes)
+        if not changes:
+            return changes
+        if self.backend is not None:
+            self.backend.reconfigure(self, changes)
+        log.info(f"Reconfigured camera '{self.name}' with '{changes}'.")
+        return changes
+
+    def get_async_bridge(self) -> Eventhandler.AsyncBridge:
+        """Bridge of the motion start and end events into asyncio, attached on first use."""
+        if self.async_bridge is None:
+            self.async_bridge = Eventhandler.AsyncBridge(maxsize=self.config.event_queue_size)
+            self.async_bridge.attach(self.motion_start_handler)
+            self.async_bridge.attach(self.motion_end_handler)
+        return self.async_bridge
+
+    def connect(self) -> None:
+        self.stream_reader = StreamReader(url=self.config.url,
+                                          buffer=self.frame_buffer,
+                                          max_fps=self.config.max_fps,
+                                          threaded=self.config.threaded_capture,
+                                          decode_scale=self.config.decode_scale,
+                                          grayscale=self.config.grayscale,
+                                          open_timeout=self.config.open_timeout,
+                                          reconnect_delay=self.config.reconnect_delay,
+                                          reconnect_max_delay=self.config.reconnect_max_delay)
+        self.update_scale()
+
+    def update_scale(self) -> None:
+        # a backend that decodes at reduced size has no full resolution keyframe to draw on
+        native = self.config.decode_scale != 1.0 and self.stream_reader.resize_scale == 1.0
+        self.contour_processor.scale = self.preprocessor.scale if native else self.config.scale
+
+    @property
+    def stream_state(self) -> str:
+        return self.stream_reader.state if self.stream_reader is not None else STREAM_DOWN
+
+    def disconnect(self) -> None:
+        if self.stream_reader is not None:
+            self.stream_reader.disconnect()
+
+    def _reset_state(self) -> None:
+        """Drop the motion state, the running event and the worker-side detector."""
+        self.motion_buffer = MotionBuffer(buffer_size=self.motion_buffer.buffer_size)
+        # an interrupted event keeps no end time in the store
+        self.event = None
+        if self.backend is not None:
+            self.backend.reset(self)
+
+    def restart(self) -> None:
+        log.warning(f"Restart camera '{self.name}'.")
+        self.disconnect()
+        self.stream_reader = None
+        self._reset_state()
+        self.stats.restarts += 1
+
+    def rewarm(self) -> None:
+        """Start the background model and motion state over, the scene may have changed while the stream was down."""
+        log.info(f"Re-warm background model of camera '{self.name}' on '{self.config.warmup_frames}' frames.")
+        self.preprocessor.reset_background()
+        self._reset_state()
+        self.warmup_remaining = self.config.warmup_frames
+        self.update_scale()
+
+    def warm_up(self, frame: ndarray) -> None:
+        if self.backend is not None:
+            self.backend.warm_up(self, frame)
+        else:
+            Detector.warm_up(self, frame)
+
+    def get_frame(self) -> ndarray:
+        return self.frame_buffer[-1]
+
+    def detect(self, frame: ndarray) -> ImageItem:
+        if self.backend is not None:
+            start = self.metrics.now()
+            image_item = self.backend.detect(self, frame)
+            self.metrics.observe("detect", start)
+            return image_item
+        return Detector.detect(self, frame)
+
+    def detach(self, image_item: ImageItem) -> ImageItem:
+        """Copy everything that still points into the frame ring or stage buffers before handing the item to a handler."""
+        if self.stream_reader is not None and self.stream_reader.convert:
+            image_item.original_frame = self.stream_reader.get_keyframe()
+        else:
+            image_item.original_frame = image_item.original_frame.copy()
+        if image_item.dilated_frame is not None:
+            image_item.dilated_frame = image_item.dilated_frame.copy()
+        # with a recorder the pre-roll goes to the clip, copying the ring a second time would stall this thread
+        if self.recorder is None:
+            image_item.frames = self.frame_buffer.snapshot()
+        image_item.encoder = self.encoder
+        if self.encoder.executor is not None:
+            image_item.prefetch_jpegs()
+        return image_item
+
+    def track_event(self, image_item: ImageItem) -> None:
+        """Give every item of a motion event the event's id and collect its contour statistics."""
+        if image_item.motion_status == MotionFlag.MotionStart:
+            self.event = EventRecord.start(self.name, image_item)
+        elif self.event is None:
+            return
+        else:
+            self.event.add(image_item)
+        image_item.event_id = self.event.event_id
+        if image_item.motion_status == MotionFlag.MotionEnd:
+            self.event.end(image_item)
+
+    def store_event(self, image_item: ImageItem) -> None:
+        if image_item.motion_status == MotionFlag.MotionStart:
+            self.event_store.put(self.event)
+            if image_item.clip_path:
+                self.event.media.append(image_item.clip_path)
+                self.event_store.add_media(self.event.event_id, image_item.clip_path)
+        elif image_item.motion_status == MotionFlag.MotionEnd and self.event is not None:
+            self.event_store.put(self.event)
+
+    def dispatch(self, image_item: ImageItem) -> None:
+        if image_item.motion_status == MotionFlag.MotionStart:
+            self.motion_start_handler.fire_event(self.detach(image_item))
+
+        elif image_item.motion_status == MotionFlag.MotionEnd:
+            self.motion_end_handler.fire_event(self.detach(image_item))
+
+    def set_fps(self, fps: float) -> None:
+        self.stats.current_fps = fps
+        if self.stream_reader is not None:
+            self.stream_reader.max_fps = fps
+
+    def step(self) -> ImageItem:
+        start = time.perf_counter()
+        if self.pending_changes:
+            self.apply_pending_changes()
+        if self.stream_reader is None:
+            self.connect()
+        frame = self.stream_reader.grab()
+        stage = self.metrics.observe("capture", start)
+        if frame is None:
+            # stream down, the reader reconnects in the background
+            return EMPTY
+        if self.stream_reader.recovered:
+            self.stream_reader.recovered = False
+            self.rewarm()
+        if self.warmup_remaining > 0:
+            self.warmup_remaining -= 1
+            self.warm_up(frame)
+            self.metrics.observe("warmup", stage)
+            return EMPTY
+        image_item = self.detect(frame)
+        stage = self.metrics.now()
+        self.track_event(image_item)
+        if self.recorder is not None:
+            self.recorder.update(image_item, self.frame_buffer)
+            stage = self.metrics.observe("record", stage)
+        if self.event_store is not None:
+            self.store_event(image_item)
+        if image_item.motion_status == MotionFlag.MotionEnd:
+            self.event = None
+        if self.heatmap is not None:
+            self.heatmap.update(image_item, scaled_size(frame, self.preprocessor.scale))
+            if self.heatmap_path and time.monotonic() - self.last_heatmap_save > self.config.heatmap_interval:
+                self.save_heatmap()
+            stage = self.metrics.observe("heatmap", stage)
+        if self.background_path and \
+                time.monotonic() - self.last_background_save > self.config.background_checkpoint_interval:
+            self.save_background()
+        if self.rate is not None:
+            self.set_fps(self.rate.update(image_item.motion_status, image_item.has_contours))
+        self.dispatch(image_item)
+        self.metrics.observe("dispatch", stage)
+        self.metrics.increment("frames_processed")
+        self.stats.frames += 1
+        self.stats.busy_time += time.perf_counter() - start
+        return image_item
@@ -1,66 +1,312 @@
+import random
 import time
+import threading
 from time import sleep
+import cv2
 from cv2 import VideoCapture
-from numpy import ndarray
+from numpy import ndarray, may_share_memory
+from typing import Callable, Optional, Tuple
 import logging
 
 from MotionDetector.buffer_frame import FrameBuffer
 
 log = logging.getLogger(__name__)
 
+STREAM_UP = "up"
+STREAM_DOWN = "down"
+
+
+class FrameGrabber(threading.Thread):
+    """Drain a VideoCapture at the native rate and keep only the newest frame."""
+
+    def __init__(self, cap: VideoCapture):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.cap = cap
+
+        self.condition = threading.Condition()
+        self.frame: ndarray = None
+        self.frame_count: int = 0
+        self.last_count: int = 0
+        self.failed: bool = False
+        self.running: bool = False
+
+    def run(self) -> None:
+        self.running = True
+        while self.running:
+            ret, frame = self.cap.read()
+            with self.condition:
+                if not ret:
+                    self.failed = True
+                    self.running = False
+                else:
+                    self.frame = frame
+                    self.frame_count += 1
+                self.condition.notify_all()
+
+    def stop(self) -> None:
+        self.running = False
+
+    def latest(self, timeout: float = None) -> Tuple[ndarray, int]:
+        """Wait for a frame newer than the last one taken, return it with the number of skipped frames."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_count > self.last_count or self.failed, timeout)
+            if self.frame_count == self.last_count:
+                return None, 0
+            skipped = self.frame_count - self.last_count - 1
+            self.last_count = self.frame_count
+            return self.frame, skipped
+
+
+class Reconnector(threading.Thread):
+    """Reopen a stream in the background with jittered exponential backoff.
+
+    Every stream retries on its own thread, so a reconnect storm never takes
+    workers of the detection pool. The opened capture is left in 'cap'.
+    """
+
+    def __init__(self,
+                 open_capture: Callable[[], Optional[VideoCapture]],
+                 url: str,
+                 base_delay: float = 1.0,
+                 max_delay: float = 120.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.open_capture = open_capture
+        self.url = url
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.attempts: int = 0
+        self.cap: VideoCapture = None
+        self.stopped = threading.Event()
+
+    def delay(self) -> float:
+        # full jitter spreads the retries of cameras that went down at the same moment
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** min(self.attempts, 32)))
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.attempts += 1
+            cap = self.open_capture()
+            if cap is not None:
+                if self.stopped.is_set():
+                    cap.release()
+                else:
+                    self.cap = cap
+                return
+            delay = self.delay()
+            log.warning(f"Reconnect to '{self.url}' failed, attempt '{self.attempts}', retry in '{delay:.1f}' seconds.")
+            self.stopped.wait(delay)
+
+    def stop(self) -> None:
+        self.stopped.set()
+
 
 class StreamReader:
     def __init__(self,
                  url: str,
                  buffer: FrameBuffer,
-                 max_fps: float = 0.5):
+                 max_fps: float = 0.5,
+                 threaded: bool = False,
+                 decode_scale: float = 1.0,
+                 grayscale: bool = False,
+                 open_timeout: float = 10.0,
+                 reconnect_delay: float = 1.0,
+                 reconnect_max_delay: float = 120.0):
         self.url = url
         self.buffer = buffer
         self.max_fps = max_fps
+        self.threaded = threaded
+
+        # decode options: reduced resolution from the backend if it supports it, otherwise resize + convert
+        self.decode_scale = decode_scale
+        self.grayscale = grayscale
+        self.resize_scale = decode_scale
+        self.keyframe: ndarray = None
+        self.resized: ndarray = None
         self.last_capture = time.time()
+        self.skipped_frames: int = 0
+        self.reconnects: int = 0
+
+        # reconnection runs in the background, grab() returns None until it succeeded
+        self.open_timeout = open_timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnector: Reconnector = None
+        self.recovered: bool = False
 
         self.cap = VideoCapture()
+        self.grabber: FrameGrabber = None
 
         self.connect()
 
+    @property
+    def convert(self) -> bool:
+        return self.grayscale or self.resize_scale != 1.0
+
+    @property
+    def state(self) -> str:
+        return STREAM_DOWN if self.reconnector is not None else STREAM_UP
+
+    def open_capture(self) -> Optional[VideoCapture]:
+        """Open a new capture of the stream, giving up after 'open_timeout' if the backend supports it."""
+        cap = VideoCapture()
+        if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+            timeout = int(self.open_timeout * 1000)
+            cap.open(self.url, cv2.CAP_ANY, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout,
+                                             cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout])
+        else:
+            cap.open(self.url)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cap
+
+    def adopt(self, cap: VideoCapture) -> None:
+        self.cap = cap
+        if self.decode_scale != 1.0:
+            self.request_decode_size()
+
+    def open(self) -> bool:
+        cap = self.open_capture()
+        if cap is None:
+            return False
+        self.adopt(cap)
+        return True
+
+    def request_decode_size(self) -> None:
+        """Ask the backend for reduced resolution output, keep resizing in software if it ignores the request."""
+        width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+        height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        size = (int(width * self.decode_scale), int(height * self.decode_scale))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        native = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) == size
+        self.resize_scale = 1.0 if native else self.decode_scale
+        log.info(f"Decode size {size} {'from backend' if native else 'by resizing'} for stream: {self.url}")
+
     def connect(self) -> None:
-        self.cap.open(self.url)
-        if not self.cap.isOpened():
+        if self.open():
+            self.capture()
+        else:
             self.reconnect()
-        self.capture()
-
-    def reconnect(self, max_sec: int = 1024) -> None:
-        sec_wait = 1
-        log.warning(f"Cannot connect to Videostream.")
-        while True:
-            self.cap.release()
-            self.cap.open(self.url)
-            if self.cap.isOpened():
-                log.info(f"Reconnection successful! to stream: {self.url}")
-                break
-
-            log.warning(f"Waiting for {sec_wait} seconds to reconnect.")
-            sleep(sec_wait)
-            sec_wait = min(max_sec, sec_wait * 2)  # limit waiting Time to max_sec
-            if sec_wait == max_sec:
-                raise ConnectionError(f"Unable to reconnect to {self.url}")
+
+    def reconnect(self) -> None:
+        """Release the capture and reopen it on a background thread."""
+        if self.reconnector is not None:
+            return
+        log.warning(f"Stream '{self.url}' is down, reconnect in the background.")
+        self.stop_grabber()
+        self.cap.release()
+        self.reconnector = Reconnector(self.open_capture,
+                                       url=self.url,
+                                       base_delay=self.reconnect_delay,
+                                       max_delay=self.reconnect_max_delay)
+        self.reconnector.start()
+
+    def recover(self) -> bool:
+        """Take over the capture once the reconnector opened it."""
+        if self.reconnector.cap is None:
+            return False
+        self.adopt(self.reconnector.cap)
+        log.info(f"Reconnected to stream '{self.url}' after '{self.reconnector.attempts}' attempts.")
+        self.reconnector = None
+        self.reconnects += 1
+        self.recovered = True
+        return True
 
     def disconnect(self) -> None:
+        if self.reconnector is not None:
+            self.reconnector.stop()
+            self.reconnector = None
+        self.stop_grabber()
         self.cap.release()
 
+    def start_grabber(self) -> None:
+        self.grabber = FrameGrabber(self.cap)
+        self.grabber.start()
+
+    def stop_grabber(self) -> None:
+        if self.grabber is None:
+            return
+        self.grabber.stop()
+        self.grabber.join(timeout=5)
+        self.grabber = None
+
     def get_frame(self):
         return self.buffer[-1]
 
+    def get_keyframe(self) -> ndarray:
+        """Copy of the newest frame at the highest resolution the decoder delivered."""
+        if self.keyframe is not None:
+            return self.keyframe.copy()
+        return self.buffer[-1].copy()
+
     def wait(self) -> None:
         secs = max((self.last_capture + 1 / self.max_fps - time.time()), 0)
         sleep(secs)
         self.last_capture = time.time()
 
-    def capture(self) -> ndarray:
+    def read_latest(self) -> Tuple[bool, ndarray]:
+        if self.grabber is None:
+            self.start_grabber()
+        frame, skipped = self.grabber.latest(timeout=10)
+        if frame is None:
+            return False, None
+        if skipped:
+            self.skipped_frames += skipped
+            log.debug(f"Skipped '{skipped}' frames, total skipped: '{self.skipped_frames}'")
+        return True, frame
+
+    def read(self) -> Tuple[bool, ndarray]:
+        if self.threaded:
+            return self.read_latest()
+        if self.convert:
+            # decode into the reused keyframe buffer, the ring buffer only gets the converted frame
+            return self.cap.read(self.keyframe) if self.keyframe is not None else self.cap.read()
+        # decode straight into the next ring buffer slot if the frame shape is already known
+        slot = self.buffer.next_slot()
+        if slot is None:
+            return self.cap.read()
+        return self.cap.read(slot)
+
+    def capture(self) -> Optional[ndarray]:
         self.wait()
-        ret, frame = self.cap.read()
+        return self.grab()
+
+    def grab(self) -> Optional[ndarray]:
+        """Read the next frame into the ring buffer, None while the stream is down."""
+        if self.reconnector is not None and not self.recover():
+            return None
+        ret, frame = self.read()
         if not ret:
             self.reconnect()
-            ret, frame = self.cap.read()
-        self.buffer.add_frame(frame.copy())
-        return frame
+            return None
+        if self.convert:
+            return self.store_converted(frame)
+        slot = self.buffer.next_slot()
+        if slot is not None and may_share_memory(frame, slot):
+            return self.buffer.commit()
+        return self.buffer.add_frame(frame)
+
+    def store_converted(self, frame: ndarray) -> ndarray:
+        """Resize and convert to grayscale straight into the next ring buffer slot."""
+        self.keyframe = frame
+        size = (int(frame.shape[1] * self.resize_scale), int(frame.shape[0] * self.resize_scale))
+        shape = size[::-1] if self.grayscale else size[::-1] + frame.shape[2:]
+        slot = self.buffer.next_slot()
+        if slot is not None and slot.shape != shape:
+            slot = None
+        if not self.grayscale:
+            converted = cv2.resize(src=frame, dsize=size, interpolation=cv2.INTER_AREA, dst=slot)
+        else:
+            if self.resize_scale != 1.0:
+                if self.resized is None or self.resized.shape[:2] != shape:
+                    self.resized = None
+                frame = self.resized = cv2.resize(src=frame, dsize=size, interpolation=cv2.INTER_AREA,
+                                                  dst=self.resized)
+            converted = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=slot)
+        if slot is not None and may_share_memory(converted, slot):
+            return self.buffer.commit()
+        return self.buffer.add_frame(converted)
@@ -1,9 +1,9 @@
 import logging
 import cv2
 from numpy import ndarray
-from typing import List, Tuple
+from typing import Tuple
 
-from MotionDetector.item_contours import ContourItem
+from MotionDetector.item_contours import ContourSet, EMPTY_CONTOURS
 from MotionDetector.item_image import ImageItem
 
 log = logging.getLogger(__name__)
@@ -18,19 +18,22 @@ class ContourProcessor:
         self.max_area_ratio = max_area_ratio
         self.scale = scale
         self.frame_area: int = 0
+        self.offset: tuple = (0, 0)
 
-    def compute_area_ratio(self, contour: ndarray) -> bool:
-        area_ratio = round((cv2.contourArea(contour) / self.frame_area) * 100, 1)
-        log.debug(f"Area ratio: '{area_ratio}'")
-        return self.min_area_ratio < area_ratio < self.max_area_ratio
-
-    def filter_contours(self, contours: Tuple[ndarray]) -> List[ContourItem]:
-        return [ContourItem(contour, self.frame_area, self.scale)
-                for contour in contours if self.compute_area_ratio(contour)]
+    def filter_contours(self, contours: Tuple[ndarray]) -> ContourSet:
+        contour_set = ContourSet.from_contours(contours, self.frame_area, self.scale, self.offset)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Area ratios: '{contour_set.ratios}'")
+        ratios = contour_set.ratios
+        return contour_set.select((self.min_area_ratio < ratios) & (ratios < self.max_area_ratio))
 
     def find_contours(self, image_item: ImageItem) -> ImageItem:
+        if image_item.gated:
+            image_item.contour_set = EMPTY_CONTOURS
+            return image_item
         frame = image_item.dilated_frame
-        self.frame_area = frame.shape[0] * frame.shape[1]
+        self.frame_area = image_item.frame_area or frame.shape[0] * frame.shape[1]
+        self.offset = image_item.roi_offset
         contours, hierarchy = cv2.findContours(frame, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        image_item.contours = self.filter_contours(contours)
+        image_item.contour_set = self.filter_contours(contours)
         return image_item
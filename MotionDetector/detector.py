@@ -0,0 +1,129 @@
+import logging
+import os
+import re
+from dataclasses import replace
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import cv2
+from numpy import ndarray
+
+from MotionDetector.buffer_motion import MotionBuffer
+from MotionDetector.contours import ContourProcessor
+from MotionDetector.item_image import ImageItem
+from MotionDetector.metrics import Metrics, DISABLED
+from MotionDetector.morphology import MorphologyStage
+from MotionDetector.preprocessor import PreProcessor
+
+if TYPE_CHECKING:
+    from MotionDetector.camera import CameraConfig
+
+log = logging.getLogger(__name__)
+
+
+class Detector:
+    """Preprocessing, contour filter and motion state of one camera.
+
+    This is all a detection worker process needs; Camera adds capture,
+    handlers and recording on top.
+    """
+
+    def __init__(self, config: "CameraConfig"):
+        self.config = config
+        self.name = config.name or config.url
+        # the preprocessor works on the decoded frame, contours are mapped back to full resolution
+        self.preprocessor = PreProcessor(scale=config.scale / config.decode_scale,
+                                         sub_threshold=config.sub_threshold,
+                                         mask_path=config.mask_path,
+                                         debug=config.debug,
+                                         morphology=MorphologyStage(**config.morphology) if config.morphology else None,
+                                         gate_threshold=config.gate_threshold,
+                                         gate_pixel_threshold=config.gate_pixel_threshold,
+                                         background_interval=config.background_interval)
+        self.contour_processor = ContourProcessor(min_area_ratio=config.min_area_ratio,
+                                                  max_area_ratio=config.max_area_ratio,
+                                                  scale=config.scale)
+        self.motion_buffer = MotionBuffer(buffer_size=2)
+        self.metrics: Metrics = DISABLED
+
+    def detect(self, frame: ndarray) -> ImageItem:
+        image_item = self.preprocessor.preprocess_image(frame)
+        start = self.metrics.now()
+        self.contour_processor.find_contours(image_item)
+        start = self.metrics.observe("contours", start)
+        image_item.motion_status = self.motion_buffer.get_motion(image_item.has_contours)
+        self.metrics.observe("motion", start)
+        return image_item
+
+    def warm_up(self, frame: ndarray) -> None:
+        """Feed the frame to the background model without detecting motion."""
+        self.preprocessor.warm_up(frame)
+
+    def check_changes(self, changes: dict) -> Tuple["CameraConfig", Optional[MorphologyStage]]:
+        """Config and morphology stage with the reloadable settings applied, ValueError if they are invalid.
+
+        Nothing is changed, the result is only committed by apply_changes.
+        """
+        try:
+            config = replace(self.config, **changes)
+            if not config.sub_threshold > 0:
+                raise ValueError(f"sub_threshold '{config.sub_threshold}' must be positive")
+            if not 0 <= config.min_area_ratio < config.max_area_ratio:
+                raise ValueError(f"area ratios '{config.min_area_ratio}' and '{config.max_area_ratio}' "
+                                 f"must fulfil 0 <= min_area_ratio < max_area_ratio")
+        except TypeError as e:
+            raise ValueError(str(e)) from e
+        if "mask_path" in changes and config.mask_path and not os.path.isfile(config.mask_path):
+            raise ValueError(f"mask '{config.mask_path}' not found")
+        morphology = None
+        if "morphology" in changes:
+            if config.morphology is not None and not isinstance(config.morphology, dict):
+                raise ValueError(f"morphology '{config.morphology}' must be a dict of MorphologyStage arguments")
+            try:
+                morphology = MorphologyStage(**(config.morphology or {}))
+            except (TypeError, cv2.error) as e:
+                raise ValueError(f"invalid morphology '{config.morphology}': {e}") from e
+        return config, morphology
+
+    def apply_changes(self, changes: dict) -> dict:
+        """Apply reloadable settings, return the changes that were applied.
+
+        Invalid settings are logged and rejected as a whole, the running ones stay.
+        """
+        try:
+            config, morphology = self.check_changes(changes)
+        except ValueError as e:
+            log.error(f"Reject settings '{changes}' of camera '{self.name}': {e}")
+            return {}
+        if "mask_path" in changes:
+            try:
+                self.preprocessor.set_mask(changes["mask_path"])
+            except (OSError, ValueError) as e:
+                log.error(f"Keep the mask of camera '{self.name}': {e}")
+                changes = {key: value for key, value in changes.items() if key != "mask_path"}
+                config = replace(config, mask_path=self.config.mask_path)
+        self.config = config
+        if "sub_threshold" in changes:
+            self.preprocessor.set_sub_threshold(self.config.sub_threshold)
+        if morphology is not None:
+            self.preprocessor.morphology = morphology
+        self.contour_processor.min_area_ratio = self.config.min_area_ratio
+        self.contour_processor.max_area_ratio = self.config.max_area_ratio
+        return changes
+
+    def state_path(self, directory: str, kind: str) -> str:
+        if not directory:
+            return ""
+        file_name = re.sub(r"[^\w.-]", "_", self.name)
+        return os.path.join(directory, f"{file_name}_{kind}.npz")
+
+    @property
+    def background_path(self) -> str:
+        return self.state_path(self.config.background_dir, "background")
+
+    def load_background(self) -> None:
+        if self.background_path and os.path.exists(self.background_path):
+            self.preprocessor.load_background(self.background_path, max_age=self.config.background_max_age)
+
+    def save_background(self) -> None:
+        if self.background_path:
+            self.preprocessor.save_background(self.background_path)
@@ -0,0 +1,32 @@
+from concurrent.futures import Executor, Future
+from typing import Callable
+from numpy import ndarray
+from cv2 import imencode, IMWRITE_JPEG_QUALITY
+
+
+class JpegEncoder:
+    """JPEG encoder with a fixed quality, optionally running on an executor shared across cameras."""
+
+    def __init__(self, quality: int = 95, executor: Executor = None):
+        self.quality = quality
+        self.params = [IMWRITE_JPEG_QUALITY, quality]
+        self.executor = executor
+
+    def encode(self, frame: ndarray) -> bytes:
+        return imencode(".jpg", frame, self.params)[1].tobytes()
+
+    def encode_into(self, future: Future, get_frame: Callable[[], ndarray]) -> None:
+        try:
+            future.set_result(self.encode(get_frame()))
+        except Exception as e:
+            future.set_exception(e)
+
+    def submit_into(self, future: Future, get_frame: Callable[[], ndarray]) -> None:
+        """Encode on the executor if there is one, otherwise right away."""
+        if self.executor is None:
+            self.encode_into(future, get_frame)
+        else:
+            self.executor.submit(self.encode_into, future, get_frame)
+
+
+DEFAULT_ENCODER = JpegEncoder()
@@ -0,0 +1,201 @@
+import logging
+import queue
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass, field, astuple
+from typing import List, Optional
+
+from MotionDetector.item_image import ImageItem
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    start_monotonic REAL NOT NULL,
+    end_time REAL,
+    end_monotonic REAL,
+    min_area_ratio REAL NOT NULL DEFAULT 0,
+    max_area_ratio REAL NOT NULL DEFAULT 0,
+    sum_area_ratio REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS events_start_time ON events (start_time);
+CREATE INDEX IF NOT EXISTS events_camera_start_time ON events (camera, start_time);
+CREATE TABLE IF NOT EXISTS media (
+    event_id TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS media_event_id ON media (event_id);
+"""
+
+UPSERT = "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+ADD_MEDIA = "INSERT INTO media VALUES (?, ?)"
+
+
+def new_event_id(image_item: ImageItem) -> str:
+    """Time sortable id that stays unique for events starting in the same millisecond."""
+    milliseconds = int(image_item.wall_time * 1000) % 1000
+    return f"{image_item.timestamp}{milliseconds:03d}-{uuid.uuid4().hex[:8]}"
+
+
+class AreaStats:
+    """Contour area ratios over the frames of an event, for dataclasses with these three fields.
+
+    'sum_area_ratio' adds the summed contour area ratio of every frame, it
+    grows with the size and the duration of the motion.
+    """
+    min_area_ratio: float
+    max_area_ratio: float
+    sum_area_ratio: float
+
+    def add(self, image_item: ImageItem) -> None:
+        if not image_item.has_contours:
+            return
+        min_ratio = image_item.min_area_ratio
+        self.min_area_ratio = min(self.min_area_ratio, min_ratio) if self.min_area_ratio else min_ratio
+        self.max_area_ratio = max(self.max_area_ratio, image_item.max_area_ratio)
+        self.sum_area_ratio += image_item.sum_area_ratio
+
+    def merge_stats(self, other: "AreaStats") -> None:
+        if other.min_area_ratio:
+            self.min_area_ratio = min(self.min_area_ratio or other.min_area_ratio, other.min_area_ratio)
+        self.max_area_ratio = max(self.max_area_ratio, other.max_area_ratio)
+        self.sum_area_ratio += other.sum_area_ratio
+
+
+@dataclass
+class EventRecord(AreaStats):
+    event_id: str
+    camera: str
+    start_time: float
+    start_monotonic: float
+    end_time: Optional[float] = None
+    end_monotonic: Optional[float] = None
+    min_area_ratio: float = 0.0
+    max_area_ratio: float = 0.0
+    sum_area_ratio: float = 0.0
+    media: List[str] = field(default_factory=list)
+
+    @classmethod
+    def start(cls, camera: str, image_item: ImageItem) -> "EventRecord":
+        record = cls(event_id=new_event_id(image_item),
+                     camera=camera,
+                     start_time=image_item.wall_time,
+                     start_monotonic=image_item.created)
+        record.add(image_item)
+        return record
+
+    def end(self, image_item: ImageItem) -> None:
+        self.end_time = image_item.wall_time
+        self.end_monotonic = image_item.created
+
+    @property
+    def row(self) -> tuple:
+        return astuple(self)[:-1]
+
+
+class EventStore(threading.Thread):
+    """Motion events of all cameras in one SQLite file.
+
+    Writes are queued and committed in batches on this thread, queries open
+    their own connection and can run next to the writer (WAL journal).
+    Range queries select by start time and use the (camera, start_time) or
+    (start_time) index.
+    """
+    _STOP = None
+
+    def __init__(self, file_path: str, batch_size: int = 500):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.input_queue = queue.SimpleQueue()
+
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.file_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def put(self, record: EventRecord) -> None:
+        """Insert or update the event, called at its start and its end."""
+        self.input_queue.put((UPSERT, record.row))
+
+    def add_media(self, event_id: str, file_path: str) -> None:
+        self.input_queue.put((ADD_MEDIA, (event_id, file_path)))
+
+    def _next_batch(self) -> list:
+        batch = [self.input_queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            try:
+                batch.append(self.input_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> None:
+        connection = self._connect()
+        running = True
+        while running:
+            batch = self._next_batch()
+            if batch[-1] is self._STOP:
+                batch.pop()
+                running = False
+            try:
+                with connection:
+                    for statement, parameters in batch:
+                        connection.execute(statement, parameters)
+            except sqlite3.Error as e:
+                log.exception(f"Failed to write '{len(batch)}' event updates: {e}")
+        connection.close()
+
+    def stop(self, timeout: float = None) -> None:
+        """Write what is queued and stop."""
+        if not self.is_alive():
+            return
+        self.input_queue.put(self._STOP)
+        self.join(timeout)
+
+    def _select(self, where: str, parameters: list) -> List[EventRecord]:
+        sql = ("SELECT events.*, (SELECT group_concat(path, char(10)) FROM media "
+               f"WHERE media.event_id = events.event_id) FROM events {where}")
+        connection = self._connect()
+        try:
+            rows = connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+        return [EventRecord(*row[:-1], media=row[-1].split("\n") if row[-1] else []) for row in rows]
+
+    def query(self,
+              camera: str = None,
+              start: float = None,
+              end: float = None,
+              limit: int = None) -> List[EventRecord]:
+        """Events that started in [start, end) as epoch seconds, oldest first."""
+        conditions, parameters = [], []
+        if camera is not None:
+            conditions.append("camera = ?")
+            parameters.append(camera)
+        if start is not None:
+            conditions.append("start_time >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("start_time < ?")
+            parameters.append(end)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        where += "ORDER BY start_time"
+        if limit is not None:
+            where += " LIMIT ?"
+            parameters.append(limit)
+        return self._select(where, parameters)
+
+    def get(self, event_id: str) -> Optional[EventRecord]:
+        records = self._select("WHERE event_id = ?", [event_id])
+        return records[0] if records else None
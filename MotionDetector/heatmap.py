@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from typing import List, Tuple
+
+import cv2
+from numpy import ndarray, zeros, full, float32, int64, savez_compressed, load, flatnonzero, argsort, clip
+
+from MotionDetector.buffer_motion import MotionFlag
+from MotionDetector.item_image import ImageItem
+from MotionDetector.preprocessor import CHECKPOINT_ERRORS
+
+log = logging.getLogger(__name__)
+
+BOXES = "boxes"
+MASK = "mask"
+
+
+class ActivityHeatmap:
+    """Where and when a camera sees motion, kept at low resolution.
+
+    The heatmap adds the seconds each grid cell was covered by a contour box
+    (BOXES) or the dilated foreground (MASK) and halves every 'half_life'
+    seconds. The activity index holds the seconds of motion per bucket of
+    'bucket_seconds' wall time in a ring of 'buckets' entries.
+    """
+
+    def __init__(self,
+                 size: Tuple[int, int] = (64, 36),
+                 half_life: float = 3600.0,
+                 source: str = BOXES,
+                 bucket_seconds: int = 60,
+                 buckets: int = 1440,
+                 max_gap: float = 5.0):
+        if source not in (BOXES, MASK):
+            raise ValueError(f"Unknown heatmap source '{source}', use '{BOXES}' or '{MASK}'.")
+        self.size = size
+        self.half_life = half_life
+        self.source = source
+        self.bucket_seconds = bucket_seconds
+        # longer gaps between two frames, e.g. while the stream was down, count as this many seconds
+        self.max_gap = max_gap
+
+        width, height = size
+        self.accumulator: ndarray = zeros((height, width), dtype=float32)
+        self.resized: ndarray = None
+        self.activity: ndarray = zeros(buckets, dtype=float32)
+        self.bucket_ids: ndarray = full(buckets, -1, dtype=int64)
+        self.last_update: float = 0.0
+        self.in_motion: bool = False
+        self.lock = threading.Lock()
+
+    def _elapsed(self, now: float) -> float:
+        elapsed = min(self.max_gap, now - self.last_update) if self.last_update else 0.0
+        self.last_update = now
+        return max(0.0, elapsed)
+
+    def _decay(self, elapsed: float) -> None:
+        if elapsed and self.half_life > 0:
+            self.accumulator *= 0.5 ** (elapsed / self.half_life)
+
+    def _add_boxes(self, image_item: ImageItem, frame_size: Tuple[int, int], weight: float) -> None:
+        contour_set = image_item.contour_set
+        if not len(contour_set):
+            return
+        width, height = self.size
+        fx, fy = width / frame_size[0], height / frame_size[1]
+        x, y = contour_set.boxes[:, 0] + contour_set.offset[0], contour_set.boxes[:, 1] + contour_set.offset[1]
+        x1, y1 = clip((x * fx).astype(int64), 0, width - 1), clip((y * fy).astype(int64), 0, height - 1)
+        x2 = clip(((x + contour_set.boxes[:, 2]) * fx).astype(int64) + 1, 1, width)
+        y2 = clip(((y + contour_set.boxes[:, 3]) * fy).astype(int64) + 1, 1, height)
+        for index in range(len(x1)):
+            self.accumulator[y1[index]:y2[index], x1[index]:x2[index]] += weight
+
+    def _add_mask(self, image_item: ImageItem, frame_size: Tuple[int, int], weight: float) -> None:
+        dilated_frame = image_item.dilated_frame
+        width, height = self.size
+        fx, fy = width / frame_size[0], height / frame_size[1]
+        (x, y), (w, h) = image_item.roi_offset, dilated_frame.shape[1::-1]
+        x1, y1 = min(width - 1, int(x * fx)), min(height - 1, int(y * fy))
+        x2, y2 = max(x1 + 1, min(width, int((x + w) * fx))), max(y1 + 1, min(height, int((y + h) * fy)))
+        if self.resized is None or self.resized.shape != (y2 - y1, x2 - x1):
+            self.resized = None
+        self.resized = cv2.resize(dilated_frame, (x2 - x1, y2 - y1), interpolation=cv2.INTER_AREA, dst=self.resized)
+        self.accumulator[y1:y2, x1:x2] += self.resized * (weight / 255)
+
+    def _add_activity(self, wall_time: float, seconds: float) -> None:
+        bucket_id = int(wall_time // self.bucket_seconds)
+        index = bucket_id % len(self.bucket_ids)
+        if self.bucket_ids[index] != bucket_id:
+            self.bucket_ids[index] = bucket_id
+            self.activity[index] = 0.0
+        self.activity[index] += seconds
+
+    def update(self, image_item: ImageItem, frame_size: Tuple[int, int]) -> None:
+        """Add the item, 'frame_size' is the size of the whole frame at processing scale."""
+        with self.lock:
+            elapsed = self._elapsed(image_item.created)
+            self._decay(elapsed)
+            # the time since the last frame is attributed to the state seen then
+            if self.in_motion:
+                self._add_activity(image_item.wall_time, elapsed)
+            self.in_motion = image_item.motion_status in (MotionFlag.MotionStart, MotionFlag.MotionOngoing)
+            if not image_item.has_contours or not elapsed:
+                return
+            if self.source == MASK and image_item.dilated_frame is not None:
+                self._add_mask(image_item, frame_size, elapsed)
+            else:
+                self._add_boxes(image_item, frame_size, elapsed)
+
+    def heatmap(self) -> ndarray:
+        """Copy of the accumulator, decayed seconds of motion per cell."""
+        with self.lock:
+            return self.accumulator.copy()
+
+    def normalized(self) -> ndarray:
+        """Heatmap scaled to 0-255, e.g. for cv2.applyColorMap."""
+        heatmap = self.heatmap()
+        peak = heatmap.max()
+        if peak > 0:
+            heatmap *= 255 / peak
+        return heatmap.astype("uint8")
+
+    def activity_index(self, since: float = None) -> List[Tuple[float, float]]:
+        """(bucket start as epoch seconds, seconds of motion) for every filled bucket, oldest first."""
+        with self.lock:
+            valid = flatnonzero(self.bucket_ids >= 0)
+            valid = valid[argsort(self.bucket_ids[valid])]
+            index = [(float(self.bucket_ids[i] * self.bucket_seconds), float(self.activity[i])) for i in valid]
+        if since is not None:
+            index = [(start, seconds) for start, seconds in index if start + self.bucket_seconds > since]
+        return index
+
+    def save(self, file_path: str) -> str:
+        """Write heatmap and activity index to a compressed .npz file."""
+        with self.lock:
+            arrays = {"heatmap": self.accumulator.copy(),
+                      "activity": self.activity.copy(),
+                      "bucket_ids": self.bucket_ids.copy()}
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{file_path}.tmp.npz"
+        savez_compressed(temp_path, **arrays, saved=time.time(), half_life=self.half_life,
+                         bucket_seconds=self.bucket_seconds)
+        os.replace(temp_path, file_path)
+        log.debug(f"Saved heatmap to '{file_path}'.")
+        return file_path
+
+    def restore(self, file_path: str) -> bool:
+        """Continue from a snapshot written by save(), decayed by the time since. False if it does not fit."""
+        try:
+            with load(file_path) as snapshot:
+                heatmap, activity, bucket_ids = snapshot["heatmap"], snapshot["activity"], snapshot["bucket_ids"]
+                bucket_seconds, saved = int(snapshot["bucket_seconds"]), float(snapshot["saved"])
+        except CHECKPOINT_ERRORS as e:
+            log.warning(f"Cannot read heatmap snapshot '{file_path}', start empty: {e}")
+            return False
+        if (heatmap.shape != self.accumulator.shape
+                or activity.shape != self.activity.shape
+                or bucket_ids.shape != self.bucket_ids.shape
+                or bucket_seconds != self.bucket_seconds):
+            log.warning(f"Heatmap snapshot '{file_path}' does not fit the configuration, start empty.")
+            return False
+        with self.lock:
+            self.accumulator[:] = heatmap
+            self.activity[:] = activity
+            self.bucket_ids[:] = bucket_ids
+            self._decay(max(0.0, time.time() - saved))
+        return True
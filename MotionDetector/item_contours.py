@@ -1,29 +1,115 @@
-from dataclasses import dataclass
-from numpy import ndarray, array
-import cv2
+from dataclasses import dataclass, field
+from typing import List, Sequence
+from numpy import ndarray, empty, zeros, arange, concatenate, cumsum, fromiter, flatnonzero, stack
+from numpy import absolute, around, add, minimum, maximum, intp, int64, float64
+
+
+def _empty_boxes() -> ndarray:
+    return empty((0, 4), dtype=int64)
+
+
+def _empty_values() -> ndarray:
+    return empty((0,), dtype=float64)
 
 
 @dataclass
+class ContourSet:
+    """Contours of one frame with their areas, bounding boxes and area ratios computed in bulk."""
+    contours: List[ndarray] = field(default_factory=list)
+    areas: ndarray = field(default_factory=_empty_values)
+    boxes: ndarray = field(default_factory=_empty_boxes)
+    ratios: ndarray = field(default_factory=_empty_values)
+    scale: float = 1.0
+    offset: tuple = (0, 0)
+
+    @classmethod
+    def from_contours(cls,
+                      contours: Sequence[ndarray],
+                      frame_area: float,
+                      scale: float = 1.0,
+                      offset: tuple = (0, 0)) -> "ContourSet":
+        count = len(contours)
+        if not count:
+            return cls(scale=scale, offset=offset)
+        lengths = fromiter(map(len, contours), dtype=intp, count=count)
+        starts = zeros(count, dtype=intp)
+        starts[1:] = cumsum(lengths)[:-1]
+        points = concatenate(contours).reshape(-1, 2).astype(int64)
+        x, y = points[:, 0], points[:, 1]
+
+        # shoelace formula over all contours at once, the last point of each contour wraps to its first
+        following = arange(1, len(points) + 1)
+        following[starts + lengths - 1] = starts
+        areas = absolute(add.reduceat(x * y[following] - x[following] * y, starts)) / 2
+
+        x_min, y_min = minimum.reduceat(x, starts), minimum.reduceat(y, starts)
+        x_max, y_max = maximum.reduceat(x, starts), maximum.reduceat(y, starts)
+        boxes = stack((x_min, y_min, x_max - x_min + 1, y_max - y_min + 1), axis=1)
+
+        ratios = around(areas / frame_area * 100, 1)
+        return cls(contours=list(contours), areas=areas, boxes=boxes, ratios=ratios, scale=scale, offset=offset)
+
+    def select(self, keep: ndarray) -> "ContourSet":
+        indices = flatnonzero(keep)
+        return ContourSet(contours=[self.contours[index] for index in indices],
+                          areas=self.areas[indices],
+                          boxes=self.boxes[indices],
+                          ratios=self.ratios[indices],
+                          scale=self.scale,
+                          offset=self.offset)
+
+    def __len__(self) -> int:
+        return len(self.contours)
+
+    def __getitem__(self, index: int) -> "ContourItem":
+        return ContourItem(self, index)
+
+    def __iter__(self):
+        return (ContourItem(self, index) for index in range(len(self)))
+
+
 class ContourItem:
-    contour: ndarray = array([])
-    frame_area: float = 0.0
-    scale: float = 0.0
+    """View on one contour of a ContourSet."""
+    __slots__ = ("contour_set", "index")
+
+    def __init__(self, contour_set: ContourSet, index: int):
+        self.contour_set = contour_set
+        self.index = index
+
+    def __repr__(self) -> str:
+        return f"ContourItem(index={self.index}, area_ratio={self.area_ratio})"
+
+    @property
+    def contour(self) -> ndarray:
+        return self.contour_set.contours[self.index]
 
     @property
-    def contour_area(self):
-        return cv2.contourArea(self.contour)
+    def contour_area(self) -> float:
+        return float(self.contour_set.areas[self.index])
 
     @property
-    def area_ratio(self):
-        return round((self.contour_area / self.frame_area) * 100, 1)
+    def area_ratio(self) -> float:
+        return float(self.contour_set.ratios[self.index])
 
     @property
     def roi(self):
-        args = cv2.boundingRect(self.contour)
-        x1, y1, w, h = [int(arg / self.scale) for arg in args]
-        return (x1, y1), (x1 + w, y1 + h)
+        (x1, y1), (x2, y2) = self.scaled_roi
+        scale = self.contour_set.scale
+        return (int(x1 / scale), int(y1 / scale)), (int(x2 / scale), int(y2 / scale))
 
     @property
     def scaled_roi(self):
-        x1, y1, w, h = cv2.boundingRect(self.contour)
+        x1, y1, w, h = (int(value) for value in self.contour_set.boxes[self.index])
+        x1, y1 = x1 + self.contour_set.offset[0], y1 + self.contour_set.offset[1]
         return (x1, y1), (x1 + w, y1 + h)
+
+
+def _read_only(values: ndarray) -> ndarray:
+    values.setflags(write=False)
+    return values
+
+
+# shared default of items without contours
+EMPTY_CONTOURS = ContourSet(areas=_read_only(_empty_values()),
+                            boxes=_read_only(_empty_boxes()),
+                            ratios=_read_only(_empty_values()))
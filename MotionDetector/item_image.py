@@ -1,35 +1,83 @@
-import datetime
-from dataclasses import dataclass, field
-from typing import List
-from numpy import ndarray, array
-from cv2 import imencode, rectangle
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from numpy import ndarray
+from cv2 import rectangle
 
-from MotionDetector.item_contours import ContourItem
+from MotionDetector.encoder import JpegEncoder, DEFAULT_ENCODER
+
+from MotionDetector.item_contours import ContourItem, ContourSet, EMPTY_CONTOURS
 from MotionDetector.buffer_motion import MotionFlag
 
+# guards the lazily created JPEG futures of all items, claims are short
+_JPEG_LOCK = threading.Lock()
+
 
-@dataclass
 class ImageItem:
-    has_data: bool = False
-    timestamp: str = ""
-    motion_status: MotionFlag = MotionFlag.NoMotion
-    original_frame: ndarray = array([])
-    resized_frame: ndarray = array([])
-    binary_frame: ndarray = array([])
-    masked_frame: ndarray = array([])
-    eroded_frame: ndarray = array([])
-    dilated_frame: ndarray = array([])
-    frames: List[ndarray] = field(default_factory=list)
-    contours: List[ContourItem] = field(default_factory=list)
-
-    def __post_init__(self):
-        self.timestamp: str = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    """Result of one frame.
+
+    'created' is the monotonic time of creation, 'wall_time' the matching
+    epoch time, which is only formatted when 'timestamp' is read. Frames that
+    were not produced stay None.
+    """
+    __slots__ = ("has_data", "gated", "created", "wall_time", "motion_status",
+                 "original_frame", "resized_frame", "binary_frame", "masked_frame", "eroded_frame", "dilated_frame",
+                 "frames", "contour_set", "roi_offset", "frame_area", "clip_path", "event_id", "encoder",
+                 "_timestamp", "_jpeg")
+
+    def __init__(self,
+                 has_data: bool = False,
+                 gated: bool = False,
+                 motion_status: MotionFlag = MotionFlag.NoMotion,
+                 original_frame: Optional[ndarray] = None,
+                 resized_frame: Optional[ndarray] = None,
+                 binary_frame: Optional[ndarray] = None,
+                 masked_frame: Optional[ndarray] = None,
+                 eroded_frame: Optional[ndarray] = None,
+                 dilated_frame: Optional[ndarray] = None,
+                 frames: Optional[ndarray] = None,
+                 contour_set: ContourSet = EMPTY_CONTOURS,
+                 roi_offset: tuple = (0, 0),
+                 frame_area: int = 0,
+                 clip_path: str = "",
+                 event_id: str = "",
+                 encoder: JpegEncoder = None):
+        self.has_data = has_data
+        self.gated = gated
+        self.created = time.monotonic()
+        self.wall_time = time.time()
+        self.motion_status = motion_status
+        self.original_frame = original_frame
+        self.resized_frame = resized_frame
+        self.binary_frame = binary_frame
+        self.masked_frame = masked_frame
+        self.eroded_frame = eroded_frame
+        self.dilated_frame = dilated_frame
+        self.frames = frames
+        self.contour_set = contour_set
+        self.roi_offset = roi_offset
+        self.frame_area = frame_area
+        self.clip_path = clip_path
+        self.event_id = event_id
+        self.encoder = encoder
+        self._timestamp: Optional[str] = None
+        self._jpeg: Optional[Dict[str, Future]] = None
+
+    def __repr__(self) -> str:
+        return (f"ImageItem(has_data={self.has_data}, gated={self.gated}, timestamp='{self.timestamp}', "
+                f"motion_status={self.motion_status}, contours={len(self.contour_set)})")
+
+    @property
+    def timestamp(self) -> str:
+        if self._timestamp is None:
+            self._timestamp = time.strftime("%Y%m%d%H%M%S", time.localtime(self.wall_time))
+        return self._timestamp
 
     @property
     def overlay_frame(self) -> ndarray:
-        frame = self.original_frame
-        contour_items = self.contours
-        for contour_item in contour_items:
+        frame = self.original_frame.copy()
+        for contour_item in self.contour_set:
             pt1, pt2 = contour_item.roi
             rectangle(img=frame,
                       pt1=pt1,
@@ -38,32 +86,84 @@ class ImageItem:
                       thickness=3)
         return frame
 
+    def _claim_jpeg(self, key: str) -> Tuple[Future, bool]:
+        """Future of the encoded JPEG and whether the caller has to encode it."""
+        with _JPEG_LOCK:
+            if self._jpeg is None:
+                self._jpeg = {}
+            future = self._jpeg.get(key)
+            if future is not None:
+                return future, False
+            future = self._jpeg[key] = Future()
+            return future, True
+
+    def _jpeg_sources(self) -> Dict[str, Callable[[], ndarray]]:
+        return {"image": lambda: self.original_frame,
+                "overlay": lambda: self.overlay_frame}
+
+    def _get_jpeg(self, key: str) -> bytes:
+        future, owner = self._claim_jpeg(key)
+        if owner:
+            (self.encoder or DEFAULT_ENCODER).encode_into(future, self._jpeg_sources()[key])
+        return future.result()
+
+    def prefetch_jpegs(self) -> None:
+        """Start encoding both JPEGs, on the encoder's executor if it has one."""
+        for key, get_frame in self._jpeg_sources().items():
+            future, owner = self._claim_jpeg(key)
+            if owner:
+                (self.encoder or DEFAULT_ENCODER).submit_into(future, get_frame)
+
     @property
     def binary_image(self) -> bytes:
-        return imencode(".jpg", self.original_frame)[1].tobytes()
+        return self._get_jpeg("image")
 
     @property
     def binary_overlay(self) -> bytes:
-        return imencode(".jpg", self.overlay_frame)[1].tobytes()
+        return self._get_jpeg("overlay")
+
+    @property
+    def contours(self) -> List[ContourItem]:
+        return list(self.contour_set)
 
     @property
     def has_contours(self) -> bool:
-        return bool(self.contours)
+        return len(self.contour_set) > 0
 
     @property
     def min_area_ratio(self) -> float:
-        return min([contour_item.area_ratio for contour_item in self.contours])
+        return float(self.contour_set.ratios.min())
 
     @property
     def max_area_ratio(self) -> float:
-        return max([contour_item.area_ratio for contour_item in self.contours])
+        return float(self.contour_set.ratios.max())
 
     @property
     def sum_area_ratio(self) -> float:
-        return sum([contour_item.area_ratio for contour_item in self.contours])
+        return float(self.contour_set.ratios.sum())
 
     @property
     def resolution(self) -> tuple:
         height = self.original_frame.shape[0]
         width = self.original_frame.shape[1]
         return tuple((width, height))
+
+
+class _EmptyImageItem(ImageItem):
+    """ImageItem that refuses changes, safe to share."""
+    __slots__ = ("_frozen",)
+
+    def __init__(self):
+        ImageItem.__init__(self)
+        # format the lazy timestamp now, it cannot be cached later
+        self._timestamp = self.timestamp
+        self._frozen = True
+
+    def __setattr__(self, name: str, value) -> None:
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"The shared EMPTY item is read-only, cannot set '{name}'.")
+        ImageItem.__setattr__(self, name, value)
+
+
+# shared result without data, e.g. for polls that find nothing
+EMPTY = _EmptyImageItem()
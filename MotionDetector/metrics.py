@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (0-100)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        total = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Stage latencies, counters and gauges of one camera.
+
+    Observations come from the thread stepping the camera, at most one at a
+    time, so no locking is needed. A disabled instance ignores everything.
+    """
+
+    def __init__(self, enabled: bool = True, labels: Dict[str, str] = None):
+        self.enabled = enabled
+        self.labels = labels or {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def now(self) -> float:
+        return time.perf_counter() if self.enabled else 0.0
+
+    def observe(self, stage: str, start: float) -> float:
+        """Record the time since 'start' for the stage and return the current time."""
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(now - start)
+        return now
+
+    def increment(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, fn: Callable[[], float]) -> None:
+        if self.enabled:
+            self.gauges[name] = fn
+
+    def snapshot(self) -> dict:
+        return {"labels": dict(self.labels),
+                "stages": {stage: {"count": histogram.count,
+                                   "sum": histogram.sum,
+                                   "p50": histogram.percentile(50),
+                                   "p95": histogram.percentile(95),
+                                   "p99": histogram.percentile(99)}
+                           for stage, histogram in list(self.histograms.items())},
+                "counters": dict(self.counters),
+                "gauges": {name: fn() for name, fn in list(self.gauges.items())}}
+
+
+DISABLED = Metrics(enabled=False)
+
+
+def _escape(value: str) -> str:
+    """Escape backslash and newline, as HELP text needs it."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    """Escape backslash, newline and double quote, as label values need it."""
+    return _escape(value).replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+
+
+def _family(lines: List[str], name: str, kind: str, description: str) -> None:
+    lines.append(f"# HELP {name} {_escape(description)}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True, prefix: str = "motion"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.metrics: List[Metrics] = []
+
+    def create(self, **labels) -> Metrics:
+        if not self.enabled:
+            return DISABLED
+        metrics = Metrics(enabled=True, labels=labels)
+        self.metrics.append(metrics)
+        return metrics
+
+    def snapshot(self) -> List[dict]:
+        return [metrics.snapshot() for metrics in self.metrics]
+
+    def render_prometheus(self) -> str:
+        """Text exposition format, every family with its HELP and TYPE line and all of its samples together."""
+        lines = []
+        _family(lines, f"{self.prefix}_stage_seconds", "histogram", "Latency of the pipeline stages per frame.")
+        for metrics in self.metrics:
+            for stage, histogram in list(metrics.histograms.items()):
+                labels = _labels({**metrics.labels, "stage": stage})
+                total = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                    total += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{self.prefix}_stage_seconds_bucket{{{labels},le="{le}"}} {total}')
+                lines.append(f"{self.prefix}_stage_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{self.prefix}_stage_seconds_count{{{labels}}} {histogram.count}")
+        counters: Dict[str, List[str]] = {}
+        gauges: Dict[str, List[str]] = {}
+        for metrics in self.metrics:
+            labels = _labels(metrics.labels)
+            for name, value in list(metrics.counters.items()):
+                counters.setdefault(name, []).append(f"{self.prefix}_{name}_total{{{labels}}} {value}")
+            for name, fn in list(metrics.gauges.items()):
+                gauges.setdefault(name, []).append(f"{self.prefix}_{name}{{{labels}}} {fn()}")
+        for name, samples in counters.items():
+            _family(lines, f"{self.prefix}_{name}_total", "counter", f"Total {name.replace('_', ' ')}.")
+            lines.extend(samples)
+        for name, samples in gauges.items():
+            _family(lines, f"{self.prefix}_{name}", "gauge", f"Current {name.replace('_', ' ')}.")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer(threading.Thread):
+    """Serve the registry in Prometheus text format on http://host:port/metrics."""
+
+    def __init__(self, registry: MetricsRegistry, port: int = 9100, host: str = "127.0.0.1"):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.rstrip("/") != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                log.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+
+    def run(self) -> None:
+        log.info(f"Serve metrics on http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+        self.server.serve_forever()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,68 @@
+import cv2
+from numpy import ndarray, zeros, uint8, count_nonzero
+
+
+def get_kernel(morph_element: int, kernel_size: int) -> ndarray:
+    return cv2.getStructuringElement(shape=morph_element,
+                                     ksize=(2 * kernel_size + 1, 2 * kernel_size + 1),
+                                     anchor=(-1, -1))
+
+
+def compose_kernel(kernel: ndarray, iterations: int) -> ndarray:
+    """Single structuring element equal to applying the symmetric kernel 'iterations' times."""
+    height, width = kernel.shape
+    composed = zeros(((height - 1) * iterations + 1, (width - 1) * iterations + 1), dtype=uint8)
+    top = (composed.shape[0] - height) // 2
+    left = (composed.shape[1] - width) // 2
+    composed[top:top + height, left:left + width] = kernel
+    if iterations > 1:
+        cv2.dilate(src=composed, kernel=kernel, dst=composed, iterations=iterations - 1)
+    return composed
+
+
+class MorphologyOperation:
+    def __init__(self,
+                 morph_type: int,
+                 morph_element: int,
+                 kernel_size: int,
+                 iterations: int,
+                 fuse: bool = None):
+        self.morph_type = morph_type
+        self.kernel = get_kernel(morph_element=morph_element, kernel_size=kernel_size)
+        self.iterations = iterations
+
+        composed = compose_kernel(self.kernel, iterations)
+        if fuse is None:
+            # a rectangular kernel runs on OpenCV's separable fast path, otherwise compare touched pixels
+            fuse = composed.all() or count_nonzero(composed) <= count_nonzero(self.kernel) * iterations
+        if fuse and iterations > 1:
+            self.kernel = composed
+            self.iterations = 1
+
+    def apply(self, frame: ndarray, dst: ndarray = None) -> ndarray:
+        return cv2.morphologyEx(src=frame, op=self.morph_type, kernel=self.kernel,
+                                iterations=self.iterations, dst=dst)
+
+
+class MorphologyStage:
+    """Erode followed by dilate with kernels built once at configuration time.
+
+    With fuse=None every operation is fused into one pass with the equivalent
+    composed kernel whenever that pass is cheaper, True/False force the choice.
+    """
+
+    def __init__(self,
+                 erode_element: int = cv2.MORPH_CROSS,
+                 erode_size: int = 1,
+                 erode_iterations: int = 3,
+                 dilate_element: int = cv2.MORPH_ELLIPSE,
+                 dilate_size: int = 2,
+                 dilate_iterations: int = 2,
+                 fuse: bool = None):
+        self.erode = MorphologyOperation(morph_type=cv2.MORPH_ERODE, morph_element=erode_element,
+                                         kernel_size=erode_size, iterations=erode_iterations, fuse=fuse)
+        self.dilate = MorphologyOperation(morph_type=cv2.MORPH_DILATE, morph_element=dilate_element,
+                                          kernel_size=dilate_size, iterations=dilate_iterations, fuse=fuse)
+
+    def apply(self, frame: ndarray, eroded: ndarray = None, dilated: ndarray = None) -> ndarray:
+        return self.dilate.apply(self.erode.apply(frame, dst=eroded), dst=dilated)
@@ -0,0 +1,219 @@
+"""
+Offline detection over video files as fast as the CPU allows.
+
+    python -m MotionDetector.offline ./test_data/test.avi --segments 4 --output events.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, replace
+from typing import List, Optional
+
+import cv2
+
+from MotionDetector.buffer_frame import FrameBuffer
+from MotionDetector.buffer_motion import MotionFlag
+from MotionDetector.camera import CameraConfig
+from MotionDetector.capture import StreamReader
+from MotionDetector.detector import Detector
+from MotionDetector.event_store import AreaStats
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class MotionEvent(AreaStats):
+    start: float
+    end: float = 0.0
+    start_frame: int = 0
+    end_frame: int = 0
+    min_area_ratio: float = 0.0
+    max_area_ratio: float = 0.0
+    sum_area_ratio: float = 0.0
+    # started during the warm-up of its segment, i.e. it continues an event of the previous segment
+    continued: bool = False
+    # still running at the end of its segment
+    open: bool = False
+
+    def merge(self, other: "MotionEvent") -> None:
+        self.end, self.end_frame, self.open = other.end, other.end_frame, other.open
+        self.merge_stats(other)
+
+
+class FileReader(StreamReader):
+    """StreamReader over a video file: decoded like a live stream, but unpaced and without reconnects."""
+
+    def __init__(self, file_path: str, config: CameraConfig):
+        self.eof: bool = False
+        StreamReader.__init__(self,
+                              url=file_path,
+                              buffer=FrameBuffer(buffer_size=2),
+                              decode_scale=config.decode_scale,
+                              grayscale=config.grayscale)
+
+    def connect(self) -> None:
+        if not self.open():
+            raise FileNotFoundError(f"Cannot open video '{self.url}'.")
+
+    def reconnect(self) -> None:
+        # a failed read of a file is its end
+        self.eof = True
+
+    def seek(self, index: int) -> bool:
+        """Position before frame 'index', False if the file ends before it.
+
+        Containers may seek to another frame than asked for or not at all, the
+        position is verified and otherwise reached by skipping from the start.
+        """
+        if index <= 0:
+            return True
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        if position == index:
+            return True
+        log.debug(f"Seek to frame '{index}' of '{self.url}' ended at '{position}', skip from the start.")
+        self.cap.release()
+        self.connect()
+        for _ in range(index):
+            if not self.cap.grab():
+                return False
+        return True
+
+    @property
+    def seconds(self) -> float:
+        """Container timestamp of the frame just decoded."""
+        return self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+
+def frame_count(file_path: str) -> int:
+    """Frame count from the container header, an estimate only; 0 if unknown."""
+    cap = cv2.VideoCapture(file_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video '{file_path}'.")
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(0, count)
+
+
+def process_segment(file_path: str,
+                    config: CameraConfig,
+                    start_frame: int,
+                    end_frame: Optional[int],
+                    warmup_frames: int = 100) -> List[MotionEvent]:
+    """Detect motion in frames [start_frame, end_frame), warming the background model up on the frames before.
+
+    An 'end_frame' of None reads to the end of the file.
+    """
+    detector = Detector(config)
+    reader = FileReader(file_path, config)
+    index = max(0, start_frame - warmup_frames)
+    events: List[MotionEvent] = []
+    if not reader.seek(index):
+        reader.disconnect()
+        log.debug(f"Segment [{start_frame}, {end_frame}) is past the end of '{file_path}'.")
+        return events
+
+    current: MotionEvent = None
+    seconds = 0.0
+    while end_frame is None or index < end_frame:
+        frame = reader.grab()
+        if frame is None:
+            break
+        seconds = reader.seconds
+        # the warm-up frames are detected too, an event running into the segment is seen as continued
+        image_item = detector.detect(frame)
+        if index >= start_frame:
+            if current is None and detector.motion_buffer.motion_flag:
+                current = MotionEvent(start=seconds, start_frame=index,
+                                      continued=image_item.motion_status != MotionFlag.MotionStart)
+            if current is not None:
+                current.add(image_item)
+                if image_item.motion_status == MotionFlag.MotionEnd:
+                    current.end, current.end_frame = seconds, index
+                    events.append(current)
+                    current = None
+        index += 1
+    reader.disconnect()
+
+    if current is not None:
+        current.end, current.end_frame, current.open = seconds, index - 1, True
+        events.append(current)
+    log.debug(f"Segment [{start_frame}, {end_frame}) of '{file_path}': {len(events)} events.")
+    return events
+
+
+def merge_segments(segments: List[List[MotionEvent]]) -> List[MotionEvent]:
+    merged: List[MotionEvent] = []
+    for events in segments:
+        for event in events:
+            if event.continued and merged and merged[-1].open:
+                merged[-1].merge(event)
+            else:
+                merged.append(event)
+    for event in merged:
+        event.continued = False
+    return merged
+
+
+def process_file(file_path: str,
+                 config: CameraConfig = None,
+                 segments: int = None,
+                 warmup_frames: int = 100) -> List[MotionEvent]:
+    """Split the file into segments, detect them in parallel processes and merge the events.
+
+    The split follows the frame count of the container header, the last
+    segment reads on to the end of the file whatever the count said.
+    """
+    config = replace(config or CameraConfig(url=file_path), url=file_path)
+    count = frame_count(file_path)
+    segments = max(1, min(segments or os.cpu_count() or 1, count // max(1, warmup_frames) or 1))
+    bounds = [(count * index // segments, count * (index + 1) // segments) for index in range(segments)]
+    bounds[-1] = (bounds[-1][0], None)
+    log.info(f"Process '{file_path}' with about {count} frames in {segments} segments.")
+
+    if segments == 1:
+        results = [process_segment(file_path, config, 0, None, warmup_frames)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=segments, mp_context=context) as executor:
+            futures = [executor.submit(process_segment, file_path, config, start, end, warmup_frames)
+                       for start, end in bounds]
+            results = [future.result() for future in futures]
+    return merge_segments(results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--mask", default=None)
+    parser.add_argument("--scale", type=float, default=0.3)
+    parser.add_argument("--sub-threshold", type=int, default=80)
+    parser.add_argument("--min-area-ratio", type=float, default=2.0)
+    parser.add_argument("--max-area-ratio", type=float, default=10.0)
+    parser.add_argument("--segments", type=int, default=None)
+    parser.add_argument("--warmup-frames", type=int, default=100)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = CameraConfig(url=args.video,
+                          mask_path=args.mask,
+                          scale=args.scale,
+                          sub_threshold=args.sub_threshold,
+                          min_area_ratio=args.min_area_ratio,
+                          max_area_ratio=args.max_area_ratio)
+    events = [asdict(event) for event in process_file(args.video, config, args.segments, args.warmup_frames)]
+    for event in events:
+        del event["continued"]
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(events, file, indent=2)
+    else:
+        print(json.dumps(events, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,361 @@
 import logging
+import os
+import time
+import zlib
+from zipfile import BadZipFile
 import cv2
-from numpy import ndarray, array
+from numpy import ndarray, array, copyto, empty, uint8, savez_compressed, load
 from os.path import isfile
+from typing import Tuple
 
 from MotionDetector.item_image import ImageItem
+from MotionDetector.morphology import MorphologyStage, get_kernel
+from MotionDetector.metrics import Metrics, DISABLED
 
 log = logging.getLogger(__name__)
 
+# what np.load raises for missing, truncated or foreign checkpoint files
+CHECKPOINT_ERRORS = (OSError, ValueError, KeyError, EOFError, BadZipFile)
 
-def resize_frame(frame: ndarray, scale: float = 1.0) -> ndarray:
+
+def scaled_size(frame: ndarray, scale: float = 1.0) -> tuple:
     height = frame.shape[0]
     width = frame.shape[1]
-    size = (int(width * scale), int(height * scale))
-    return cv2.resize(src=frame, dsize=size)
+    return int(width * scale), int(height * scale)
 
 
-def get_kernel(morph_element: int, kernel_size: int) -> ndarray:
-    return cv2.getStructuringElement(shape=morph_element,
-                                     ksize=(2 * kernel_size + 1, 2 * kernel_size + 1),
-                                     anchor=(-1, -1))
+def resize_frame(frame: ndarray, scale: float = 1.0, dst: ndarray = None) -> ndarray:
+    return cv2.resize(src=frame, dsize=scaled_size(frame, scale), dst=dst)
 
 
 def morphological_transformation(frame: ndarray,
                                  morph_type: int,
                                  morph_element: int,
                                  kernel_size: int,
-                                 iterations: int) -> ndarray:
+                                 iterations: int,
+                                 dst: ndarray = None) -> ndarray:
     kernel = get_kernel(morph_element=morph_element, kernel_size=kernel_size)
-    return cv2.morphologyEx(src=frame, op=morph_type, kernel=kernel, iterations=iterations)
+    return cv2.morphologyEx(src=frame, op=morph_type, kernel=kernel, iterations=iterations, dst=dst)
 
 
 class PreProcessor:
     def __init__(self,
                  scale: float = 1.0,
                  sub_threshold: int = 25,
-                 mask_path: str = None):
+                 mask_path: str = None,
+                 debug: bool = False,
+                 morphology: MorphologyStage = None,
+                 crop_to_mask: bool = True,
+                 gate_threshold: float = None,
+                 gate_pixel_threshold: int = 10,
+                 gate_size: Tuple[int, int] = (64, 36),
+                 background_interval: int = 10):
         self.scale = scale
+        self.debug = debug
+        self.morphology = morphology or MorphologyStage()
+        self.crop_to_mask = crop_to_mask
+        self.mask_path = mask_path
+        # the mask as loaded and the copy fitted to the processing size, which is known with the first frame
+        self.mask_source = self._load_mask(mask_path) if mask_path else array([])
+        self.frame_size: Tuple[int, int] = None
+        self._set_mask(self.mask_source)
+        self.buffers = {}
+        self.metrics: Metrics = DISABLED
+
+        # pre-gate: skip the expensive path for frames that hardly differ from the last processed one.
+        # A thumbnail pixel averages a whole cell of the frame (30x30 pixels of a 1920x1080 frame at 64x36),
+        # an object changes it by its contrast times the share of the cell it covers. An object of contrast
+        # 50 thus needs to cover a fifth of a cell (about 13x13 pixels) to pass a pixel threshold of 10.
+        if gate_threshold is not None and not 0 <= gate_threshold < 1:
+            raise ValueError(f"gate_threshold '{gate_threshold}' must be a fraction of the thumbnail in [0, 1)")
+        self.gate_threshold = gate_threshold
+        self.gate_pixel_threshold = gate_pixel_threshold
+        self.gate_size = gate_size
+        self.background_interval = max(1, background_interval)
+        self.gate_reference: ndarray = None
+        self.foreground: bool = False
+        self.frames_gated: int = 0
+        self.frames_processed: int = 0
+
+        self.sub_threshold = sub_threshold
+        self.subtractor = self._create_subtractor()
+        # background image of a checkpoint, seeds the model with the first frame of the same geometry
+        self.pending_background: ndarray = None
+        self.pending_roi: Tuple[int, int, int, int] = None
+        self.pending_frame_size: Tuple[int, int] = None
+
+    def _create_subtractor(self) -> cv2.BackgroundSubtractorMOG2:
+        return cv2.createBackgroundSubtractorMOG2(varThreshold=self.sub_threshold, detectShadows=False)
+
+    def set_sub_threshold(self, sub_threshold: int) -> None:
+        """Change the threshold of the running model, its learned background is kept."""
+        self.sub_threshold = sub_threshold
+        self.subtractor.setVarThreshold(sub_threshold)
+
+    def set_mask(self, mask_path: str) -> None:
+        """Swap the mask, the background model is kept if the processed area stays the same."""
+        mask_source = self._load_mask(mask_path) if mask_path else array([])
+        roi, size = self.roi, self.frame_size
         self.mask_path = mask_path
-        self.mask = self._load_mask() if mask_path else array([])
-        self.subtractor = cv2.createBackgroundSubtractorMOG2(varThreshold=sub_threshold, detectShadows=False)
+        self.mask_source = mask_source
+        self._set_mask(self._resize_mask(mask_source, size) if size else mask_source)
+        if self.roi != roi:
+            log.info(f"Processed area changed from '{roi}' to '{self.roi}', learn the background again.")
+            self.reset_background()
+
+    def reset_background(self) -> None:
+        """Learn the background from scratch and drop the gate reference."""
+        self.subtractor = self._create_subtractor()
+        self.pending_background = None
+        self.gate_reference = None
+        self.foreground = False
 
-    def _subtract_background(self, frame: ndarray) -> ndarray:
-        return self.subtractor.apply(frame)
+    @property
+    def mask_crc(self) -> int:
+        """Checksum of the loaded mask, 0 without one."""
+        return zlib.crc32(self.mask_source.tobytes()) if self.mask_source.size else 0
 
-    def _load_mask(self) -> ndarray:
-        if not isfile(self.mask_path):
-            raise FileNotFoundError(f"Mask '{self.mask_path}' not found.")
-        mask = cv2.imread(self.mask_path)
+    def save_background(self, file_path: str) -> bool:
+        """Checkpoint the learned background image with the geometry and settings it belongs to."""
+        if not self.frames_processed:
+            return False
+        background = self.subtractor.getBackgroundImage()
+        if background is None:
+            return False
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # written aside and renamed, a crash while saving leaves the last checkpoint intact
+        temp_path = f"{file_path}.tmp.npz"
+        savez_compressed(temp_path,
+                         background=background,
+                         saved=time.time(),
+                         scale=self.scale,
+                         frame_size=array(self.frame_size or (0, 0)),
+                         roi=array(self.roi or (0, 0, 0, 0)),
+                         mask_crc=self.mask_crc,
+                         sub_threshold=self.sub_threshold,
+                         history=self.subtractor.getHistory())
+        os.replace(temp_path, file_path)
+        log.debug(f"Saved background model to '{file_path}'.")
+        return True
+
+    def _checkpoint_mismatch(self, checkpoint) -> str:
+        """What of the current settings the checkpoint was not taken with, empty if it fits."""
+        if float(checkpoint["scale"]) != self.scale:
+            return "scale"
+        if int(checkpoint["mask_crc"]) != self.mask_crc:
+            return "mask"
+        if int(checkpoint["sub_threshold"]) != self.sub_threshold:
+            return "sub_threshold"
+        if int(checkpoint["history"]) != self.subtractor.getHistory():
+            return "history"
+        return ""
+
+    def load_background(self, file_path: str, max_age: float = 3600.0) -> bool:
+        """Warm-start from a checkpoint unless it is older than 'max_age' seconds or was taken with other settings."""
+        try:
+            with load(file_path) as checkpoint:
+                age = time.time() - float(checkpoint["saved"])
+                mismatch = self._checkpoint_mismatch(checkpoint)
+                if age > max_age:
+                    log.info(f"Background checkpoint '{file_path}' is '{age:.0f}' seconds old, learn from scratch.")
+                    return False
+                if mismatch:
+                    log.info(f"Background checkpoint '{file_path}' was taken with another '{mismatch}', "
+                             f"learn from scratch.")
+                    return False
+                background = checkpoint["background"]
+                roi = tuple(int(value) for value in checkpoint["roi"])
+                frame_size = tuple(int(value) for value in checkpoint["frame_size"])
+        except CHECKPOINT_ERRORS as e:
+            log.warning(f"Cannot read background checkpoint '{file_path}', learn from scratch: {e}")
+            self.reset_background()
+            return False
+        self.pending_background = background
+        self.pending_roi = roi
+        self.pending_frame_size = frame_size
+        log.info(f"Warm-start background model from '{file_path}', '{age:.0f}' seconds old.")
+        return True
+
+    def _warm_start(self, frame: ndarray) -> None:
+        background, self.pending_background = self.pending_background, None
+        # the mask is fitted to the processing size with the first frame, compare the geometry only now
+        if background.shape != frame.shape \
+                or self.pending_frame_size != self.frame_size \
+                or self.pending_roi != (self.roi or (0, 0, 0, 0)):
+            log.info("Background checkpoint does not fit the processed area, learn from scratch.")
+            return
+        # a learning rate of 1 sets the model to this image at once
+        self.subtractor.apply(background, learningRate=1.0)
+
+    def _subtract_background(self, frame: ndarray, dst: ndarray = None) -> ndarray:
+        if self.pending_background is not None:
+            self._warm_start(frame)
+        return self.subtractor.apply(frame, fgmask=dst)
+
+    def _buffer(self, stage: str, shape: tuple) -> ndarray:
+        """Per-stage output buffer, reallocated only when the frame geometry changes."""
+        buffer = self.buffers.get(stage)
+        if buffer is None or buffer.shape != shape:
+            buffer = self.buffers[stage] = empty(shape, dtype=uint8)
+        return buffer
+
+    @staticmethod
+    def _load_mask(mask_path: str) -> ndarray:
+        if not isfile(mask_path):
+            raise FileNotFoundError(f"Mask '{mask_path}' not found.")
+        mask = cv2.imread(mask_path)
+        if mask is None:
+            raise ValueError(f"Mask '{mask_path}' is no readable image.")
         mask = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
         # threshType:  0=Binary, 1=Binary_inv, 2=Trunc, 3=ToZero, 4=ToZero_inv
         return cv2.threshold(src=mask, thresh=128, maxval=255, type=0)[1]
 
-    def _mask_image(self, frame: ndarray) -> ndarray:
-        if frame.shape != self.mask.shape:
-            raise RuntimeError(f"Shape of mask '{self.mask.shape}' does not fit to frame shape '{frame.shape}'")
-        return cv2.bitwise_and(frame, self.mask)
+    @staticmethod
+    def _resize_mask(mask: ndarray, size: Tuple[int, int]) -> ndarray:
+        if not mask.any() or mask.shape == size[::-1]:
+            return mask
+        log.info(f"Resize mask from '{mask.shape[::-1]}' to processing size '{size}'.")
+        return cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+
+    def _set_mask(self, mask: ndarray) -> None:
+        self.mask = mask
+        self.has_mask = bool(self.mask.any())
+        self.roi = self._find_roi() if self.crop_to_mask and self.has_mask else None
+        self.roi_mask = self._crop_mask()
+
+    def _find_roi(self) -> Tuple[int, int, int, int]:
+        """Bounding box (x, y, w, h) of the non-zero mask, None if it covers the whole frame."""
+        roi = cv2.boundingRect(self.mask)
+        if roi == (0, 0, self.mask.shape[1], self.mask.shape[0]):
+            return None
+        log.debug(f"Process only the mask bounding box '{roi}' of '{self.mask.shape[::-1]}'.")
+        return roi
+
+    def _crop_mask(self) -> ndarray:
+        if self.roi is None:
+            return self.mask
+        x, y, w, h = self.roi
+        return self.mask[y:y + h, x:x + w]
+
+    def _crop_frame(self, frame: ndarray) -> Tuple[ndarray, Tuple[int, int]]:
+        """View of the frame area covered by the mask bounding box and the size it is resized to."""
+        size = scaled_size(frame, self.scale)
+        if size != self.frame_size:
+            self.frame_size = size
+            self._set_mask(self._resize_mask(self.mask_source, size))
+        if self.roi is None:
+            return frame, size
+        x, y, w, h = self.roi
+        x1, y1 = min(frame.shape[1], int((x + w) / self.scale)), min(frame.shape[0], int((y + h) / self.scale))
+        return frame[int(y / self.scale):y1, int(x / self.scale):x1], (w, h)
+
+    @property
+    def roi_offset(self) -> Tuple[int, int]:
+        return (self.roi[0], self.roi[1]) if self.roi else (0, 0)
+
+    def _mask_image(self, frame: ndarray, dst: ndarray = None) -> ndarray:
+        if frame.shape != self.roi_mask.shape:
+            raise RuntimeError(f"Shape of mask '{self.roi_mask.shape}' does not fit to frame shape '{frame.shape}'")
+        return cv2.bitwise_and(frame, self.roi_mask, dst=dst)
+
+    def _gate(self, frame: ndarray) -> bool:
+        """True if less than gate_threshold of the thumbnail pixels changed by more than gate_pixel_threshold.
+
+        Compared to the last processed frame; a mean over the thumbnail would let small objects drown.
+        """
+        cropped_frame, _ = self._crop_frame(frame)
+        width, height = self.gate_size
+        thumbnail = cv2.resize(src=cropped_frame, dsize=self.gate_size, interpolation=cv2.INTER_AREA,
+                               dst=self._buffer("thumbnail", (height, width) + frame.shape[2:]))
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY, dst=self._buffer("thumbnail_gray", (height, width)))
+        if self.gate_reference is None or self.foreground:
+            self.gate_reference = thumbnail.copy()
+            return False
+        diff = cv2.absdiff(thumbnail, self.gate_reference, dst=self._buffer("thumbnail_diff", (height, width)))
+        _, changed = cv2.threshold(diff, self.gate_pixel_threshold, 255, cv2.THRESH_BINARY,
+                                   dst=self._buffer("thumbnail_changed", (height, width)))
+        if cv2.countNonZero(changed) < self.gate_threshold * changed.size:
+            return True
+        copyto(self.gate_reference, thumbnail)
+        return False
+
+    def _learn_background(self, frame: ndarray) -> None:
+        cropped_frame, (width, height) = self._crop_frame(frame)
+        resized_frame = cv2.resize(src=cropped_frame, dsize=(width, height),
+                                   dst=self._buffer("resized", (height, width) + frame.shape[2:]))
+        self._subtract_background(resized_frame, dst=self._buffer("binary", (height, width)))
+
+    def warm_up(self, frame: ndarray) -> None:
+        """Feed the frame to the background model only, past the gate and without counting it."""
+        self._learn_background(frame)
+
+    def _skip_image(self, frame: ndarray) -> ImageItem:
+        self.frames_gated += 1
+        if self.frames_gated % self.background_interval == 0:
+            self._learn_background(frame)
+        return ImageItem(has_data=True,
+                         gated=True,
+                         original_frame=frame,
+                         roi_offset=self.roi_offset,
+                         frame_area=self.frame_area(frame))
 
     def preprocess_image(self, frame: ndarray) -> ImageItem:
-        resized_frame = resize_frame(frame, self.scale)
+        if self.gate_threshold is not None:
+            start = self.metrics.now()
+            gated = self._gate(frame)
+            self.metrics.observe("gate", start)
+            if gated:
+                return self._skip_image(frame)
+        self.frames_processed += 1
+        image_item = self._preprocess_image(frame)
+        self.foreground = bool(cv2.countNonZero(image_item.dilated_frame))
+        return image_item
+
+    def _preprocess_image(self, frame: ndarray) -> ImageItem:
+        if self.debug:
+            return self.preprocess_image_debug(frame)
+        metrics = self.metrics
+        start = metrics.now()
+        cropped_frame, (width, height) = self._crop_frame(frame)
+        resized_frame = cv2.resize(src=cropped_frame, dsize=(width, height),
+                                   dst=self._buffer("resized", (height, width) + frame.shape[2:]))
+        start = metrics.observe("resize", start)
+        binary_frame = self._subtract_background(resized_frame, dst=self._buffer("binary", (height, width)))
+        start = metrics.observe("subtract", start)
+        if self.has_mask:
+            self._mask_image(binary_frame, dst=binary_frame)
+            start = metrics.observe("mask", start)
+        eroded_frame = self.morphology.erode.apply(binary_frame, dst=self._buffer("eroded", (height, width)))
+        start = metrics.observe("erode", start)
+        dilated_frame = self.morphology.dilate.apply(eroded_frame, dst=self._buffer("dilated", (height, width)))
+        metrics.observe("dilate", start)
+        return ImageItem(has_data=True,
+                         original_frame=frame,
+                         dilated_frame=dilated_frame,
+                         roi_offset=self.roi_offset,
+                         frame_area=self.frame_area(frame))
+
+    def preprocess_image_debug(self, frame: ndarray) -> ImageItem:
+        cropped_frame, size = self._crop_frame(frame)
+        resized_frame = cv2.resize(src=cropped_frame, dsize=size)
         binary_frame = self._subtract_background(resized_frame)
-        masked_frame = self._mask_image(binary_frame) if self.mask.any() else binary_frame
-        eroded_frame = morphological_transformation(frame=masked_frame, morph_type=cv2.MORPH_ERODE,
-                                                    morph_element=cv2.MORPH_CROSS, kernel_size=1, iterations=3)
-        dilated_frame = morphological_transformation(frame=eroded_frame, morph_type=cv2.MORPH_DILATE,
-                                                     morph_element=cv2.MORPH_ELLIPSE, kernel_size=2, iterations=2)
+        masked_frame = self._mask_image(binary_frame) if self.has_mask else binary_frame
+        eroded_frame = self.morphology.erode.apply(masked_frame)
+        dilated_frame = self.morphology.dilate.apply(eroded_frame)
         return ImageItem(has_data=True,
                          original_frame=frame,
                          resized_frame=resized_frame,
                          binary_frame=binary_frame,
                          masked_frame=masked_frame,
                          eroded_frame=eroded_frame,
-                         dilated_frame=dilated_frame)
+                         dilated_frame=dilated_frame,
+                         roi_offset=self.roi_offset,
+                         frame_area=self.frame_area(frame))
+
+    def frame_area(self, frame: ndarray) -> int:
+        """Area of the whole frame at processing scale, the reference for contour area ratios."""
+        width, height = scaled_size(frame, self.scale)
+        return width * height
@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+from os import path
+
+import cv2
+from numpy import ndarray
+
+from MotionDetector.buffer_frame import FrameBuffer
+from MotionDetector.buffer_motion import MotionFlag
+from MotionDetector.item_image import ImageItem
+
+log = logging.getLogger(__name__)
+
+
+class ClipRecorder(threading.Thread):
+    """Record each motion event to a video file while it happens.
+
+    At MotionStart a clip is opened and seeded with the frame buffer as
+    pre-roll, every following frame is appended until 'post_roll' frames
+    after MotionEnd. Encoding runs on this thread, the detector thread only
+    queues frames and never waits for it: on a full queue frames are
+    dropped, a clip that cannot be opened is skipped and a close is retried
+    with the next frame until it fits.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 name: str = "",
+                 fps: float = 1.0,
+                 fourcc: str = "MJPG",
+                 post_roll: int = 5,
+                 max_queue: int = 100):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.directory = directory
+        self.name_prefix = f"{name}_" if name else ""
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.post_roll = post_roll
+        self.input_queue = queue.Queue(maxsize=max_queue)
+
+        self.recording: bool = False
+        self.post_roll_left: int = 0
+        self.close_pending: bool = False
+        self.dropped_frames: int = 0
+        self.skipped_clips: int = 0
+        self.stalls: int = 0
+        self.writer: cv2.VideoWriter = None
+
+    def _put_frame(self, frame: ndarray) -> None:
+        try:
+            self.input_queue.put_nowait(("frame", frame.copy()))
+        except queue.Full:
+            self.dropped_frames += 1
+            log.warning(f"Clip recorder queue full, dropped frame. Dropped in total: '{self.dropped_frames}'")
+
+    def _stall(self, message: str) -> None:
+        self.stalls += 1
+        log.warning(f"Clip recorder queue full, {message}. Stalls in total: '{self.stalls}'")
+
+    def _put_close(self) -> None:
+        try:
+            self.input_queue.put_nowait(("close",))
+            self.close_pending = False
+        except queue.Full:
+            if not self.close_pending:
+                self._stall("close the clip later")
+            self.close_pending = True
+
+    def _put_open(self, file_path: str, frames: ndarray) -> bool:
+        try:
+            self.input_queue.put_nowait(("open", file_path, frames))
+        except queue.Full:
+            self.skipped_clips += 1
+            self._stall(f"skipped clip '{file_path}'")
+            return False
+        # opening a clip closes the previous one
+        self.close_pending = False
+        return True
+
+    def update(self, image_item: ImageItem, frame_buffer: FrameBuffer) -> None:
+        """Feed the result of one frame, called on the detector thread before the item is dispatched."""
+        if self.close_pending:
+            self._put_close()
+        if image_item.motion_status == MotionFlag.MotionStart:
+            if self.recording:
+                self.post_roll_left = self.post_roll
+                self._put_frame(image_item.original_frame)
+                return
+            file_path = path.join(self.directory, f"{self.name_prefix}{image_item.event_id or image_item.timestamp}.avi")
+            if not self._put_open(file_path, frame_buffer.snapshot()):
+                return
+            image_item.clip_path = file_path
+            self.recording = True
+            self.post_roll_left = self.post_roll
+            return
+
+        if not self.recording:
+            return
+        if image_item.motion_status == MotionFlag.NoMotion and self.post_roll_left <= 0:
+            self.recording = False
+            self._put_close()
+            return
+        self._put_frame(image_item.original_frame)
+        if image_item.motion_status == MotionFlag.MotionOngoing:
+            self.post_roll_left = self.post_roll
+        elif image_item.motion_status == MotionFlag.NoMotion:
+            self.post_roll_left -= 1
+
+    def _open(self, file_path: str, frames: ndarray) -> None:
+        if not len(frames):
+            return
+        height, width = frames[0].shape[:2]
+        self.writer = cv2.VideoWriter(file_path, self.fourcc, self.fps, (width, height), frames[0].ndim == 3)
+        log.info(f"Write Video to path: {file_path}")
+        for frame in frames:
+            self.writer.write(frame)
+
+    def _close(self) -> None:
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def run(self) -> None:
+        while True:
+            message = self.input_queue.get()
+            try:
+                if message is None:
+                    self._close()
+                    break
+                if message[0] == "open":
+                    self._close()
+                    self._open(message[1], message[2])
+                elif message[0] == "frame" and self.writer is not None:
+                    self.writer.write(message[1])
+                elif message[0] == "close":
+                    self._close()
+            except Exception as e:
+                log.exception(e)
+            finally:
+                self.input_queue.task_done()
+
+    def stop(self, timeout: float = None) -> None:
+        """Write what is queued, close the clip and stop. Waits at most 'timeout' seconds."""
+        if not self.is_alive():
+            return
+        try:
+            self.input_queue.put(None, timeout=timeout)
+        except queue.Full:
+            log.warning(f"Clip recorder did not drain its queue within '{timeout}' seconds.")
+            return
+        self.join(timeout)
@@ -0,0 +1,50 @@
+import time
+from dataclasses import dataclass
+
+from MotionDetector.buffer_motion import MotionFlag
+
+EXPONENTIAL = "exponential"
+LINEAR = "linear"
+
+
+@dataclass
+class AdaptiveRate:
+    """Frame rate that follows the motion state.
+
+    While contours are seen or motion is ongoing the rate moves towards
+    'active_fps', 'ramp_up' is the fraction of the gap closed per frame
+    (1.0 jumps at once). Without motion it decays back to 'idle_fps',
+    halving the distance every 'decay' seconds (EXPONENTIAL) or crossing
+    the whole range in 'decay' seconds (LINEAR).
+    """
+    idle_fps: float = 0.5
+    active_fps: float = 5.0
+    ramp_up: float = 1.0
+    decay: float = 10.0
+    curve: str = EXPONENTIAL
+    fps: float = 0.0
+    last_update: float = 0.0
+
+    def __post_init__(self):
+        if not 0 < self.idle_fps <= self.active_fps:
+            raise ValueError("Frame rates must fulfil 0 < idle_fps <= active_fps.")
+        if self.curve not in (EXPONENTIAL, LINEAR):
+            raise ValueError(f"Unknown decay curve '{self.curve}'.")
+        self.fps = self.fps or self.idle_fps
+        self.last_update = self.last_update or time.monotonic()
+
+    def update(self, motion_status: MotionFlag, has_contours: bool = False, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        elapsed = max(0.0, now - self.last_update)
+        self.last_update = now
+
+        if has_contours or motion_status in (MotionFlag.MotionStart, MotionFlag.MotionOngoing):
+            self.fps += (self.active_fps - self.fps) * self.ramp_up
+        elif self.decay <= 0:
+            self.fps = self.idle_fps
+        elif self.curve == EXPONENTIAL:
+            self.fps = self.idle_fps + (self.fps - self.idle_fps) * 0.5 ** (elapsed / self.decay)
+        else:
+            step = (self.active_fps - self.idle_fps) * elapsed / self.decay
+            self.fps = max(self.idle_fps, self.fps - step)
+        return self.fps
@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List
+
+from MotionDetector.backend_process import ProcessBackend
+from MotionDetector.camera import Camera, CameraConfig, CameraStats
+from MotionDetector.event_store import EventStore
+from MotionDetector.metrics import MetricsRegistry, MetricsServer
+
+log = logging.getLogger(__name__)
+
+
+class MotionSupervisor(threading.Thread):
+    """Schedule capture and detection of many cameras on one bounded worker pool."""
+
+    def __init__(self,
+                 configs: List[CameraConfig],
+                 max_workers: int = None,
+                 backend: str = "thread",
+                 encoder_workers: int = 0,
+                 metrics: bool = True,
+                 metrics_port: int = None,
+                 restart_delay: float = 5.0,
+                 report_interval: float = 60.0,
+                 event_db: str = None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.exception = None
+
+        self.cameras: List[Camera] = [Camera(config) for config in configs]
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.restart_delay = restart_delay
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown backend '{backend}', use 'thread' or 'process'.")
+        self.backend = ProcessBackend(processes=self.max_workers) if backend == "process" else None
+        for camera in self.cameras:
+            camera.set_backend(self.backend)
+        # JPEG encoding of event images shared by all cameras, 0 encodes on the subscriber's thread
+        self.encoder_pool = ThreadPoolExecutor(max_workers=encoder_workers,
+                                               thread_name_prefix="jpeg") if encoder_workers else None
+        for camera in self.cameras:
+            camera.encoder.executor = self.encoder_pool
+        # motion events of all cameras in one SQLite file
+        self.event_store = EventStore(event_db) if event_db else None
+        for camera in self.cameras:
+            camera.event_store = self.event_store
+        self.metrics = MetricsRegistry(enabled=metrics)
+        for camera in self.cameras:
+            camera.set_metrics(self.metrics.create(camera=camera.name))
+        self.metrics_server = MetricsServer(self.metrics, port=metrics_port) if metrics and metrics_port else None
+        self.report_interval = report_interval
+        self.last_report = time.time()
+
+        self.executor: ThreadPoolExecutor = None
+        self.wakeup = threading.Event()
+        self.running: bool = False
+
+    def get_camera(self, name: str) -> Camera:
+        for camera in self.cameras:
+            if camera.name == name:
+                return camera
+        raise KeyError(f"No camera named '{name}'.")
+
+    def get_stats(self) -> Dict[str, CameraStats]:
+        return {camera.name: camera.stats for camera in self.cameras}
+
+    def get_metrics(self) -> list:
+        return self.metrics.snapshot()
+
+    def report(self) -> None:
+        for camera in self.cameras:
+            log.info(f"Camera '{camera.name}' stream {camera.stream_state}: {camera.stats.fps:.2f} fps (current rate {camera.stats.current_fps:.2f}), "
+                     f"latency {camera.stats.mean_latency * 1000:.1f} ms, "
+                     f"errors '{camera.stats.errors}', restarts '{camera.stats.restarts}'")
+        self.last_report = time.time()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wakeup.set()
+
+    def _on_done(self, camera: Camera, future: Future) -> None:
+        exception = future.exception()
+        if exception is not None:
+            log.exception(exception, exc_info=exception)
+            camera.exception = exception
+            camera.stats.errors += 1
+            try:
+                camera.restart()
+            except Exception as e:
+                log.exception(e)
+            camera.next_due = time.time() + self.restart_delay
+        else:
+            # the step may have raised the frame rate, pull the next capture forward
+            camera.next_due = min(camera.next_due, camera.last_submit + 1 / camera.stats.current_fps)
+        camera.busy = False
+        self.wakeup.set()
+
+    def schedule(self) -> float:
+        """Submit every idle camera that is due, return the seconds until the next one is."""
+        now = time.time()
+        timeout = self.restart_delay
+        for camera in self.cameras:
+            if camera.busy:
+                continue
+            if now < camera.next_due:
+                timeout = min(timeout, camera.next_due - now)
+                continue
+            camera.busy = True
+            camera.last_submit = now
+            camera.next_due = now + 1 / camera.stats.current_fps
+            future = self.executor.submit(camera.step)
+            future.add_done_callback(partial(self._on_done, camera))
+        return timeout
+
+    def run(self) -> None:
+        for camera in self.cameras:
+            camera.start_handlers()
+        if self.backend is not None:
+            self.backend.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.event_store is not None:
+            self.event_store.start()
+
+        self.running = True
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="motion") as self.executor:
+            while self.running:
+                try:
+                    self.wakeup.clear()
+                    timeout = self.schedule()
+                    if time.time() - self.last_report > self.report_interval:
+                        self.report()
+                    self.wakeup.wait(timeout)
+                except Exception as e:
+                    self.exception = e
+                    log.exception(e)
+                    break
+
+        for camera in self.cameras:
+            camera.disconnect()
+            camera.stop_handlers(timeout=10)
+            camera.save_state()
+        if self.backend is not None:
+            self.backend.shutdown()
+        if self.encoder_pool is not None:
+            self.encoder_pool.shutdown()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.event_store is not None:
+            self.event_store.stop(timeout=10)
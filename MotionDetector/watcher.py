@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+import threading
+from typing import Tuple
+
+log = logging.getLogger(__name__)
+
+
+def _stamp(file_path: str) -> Tuple[str, float]:
+    try:
+        return file_path, os.path.getmtime(file_path)
+    except (OSError, TypeError):
+        return file_path, 0.0
+
+
+class ConfigWatcher(threading.Thread):
+    """Poll the camera's mask and an optional JSON settings file and hand changes to Camera.reconfigure.
+
+    The settings file holds any of the reloadable settings, e.g.
+    {"sub_threshold": 60, "min_area_ratio": 1.5, "morphology": {"dilate_iterations": 3}}
+    """
+
+    def __init__(self, camera, settings_path: str = None, interval: float = 2.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.camera = camera
+        self.settings_path = settings_path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+        self.mask_stamp = _stamp(camera.config.mask_path)
+        self.settings_stamp = _stamp(settings_path)
+
+    def check_settings(self) -> None:
+        stamp = _stamp(self.settings_path)
+        if stamp == self.settings_stamp or not stamp[1]:
+            return
+        self.settings_stamp = stamp
+        try:
+            with open(self.settings_path) as file:
+                settings = json.load(file)
+            self.camera.reconfigure(**settings)
+        except (OSError, ValueError, TypeError) as e:
+            log.error(f"Cannot reload settings '{self.settings_path}' of camera '{self.camera.name}': {e}")
+
+    def check_mask(self) -> None:
+        # follows the mask path, it may have been changed by the settings file
+        stamp = _stamp(self.camera.config.mask_path)
+        if stamp == self.mask_stamp or not stamp[1]:
+            return
+        self.mask_stamp = stamp
+        try:
+            self.camera.reconfigure(mask_path=stamp[0])
+        except ValueError as e:
+            log.error(f"Cannot reload mask '{stamp[0]}' of camera '{self.camera.name}': {e}")
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if self.settings_path:
+                self.check_settings()
+            self.check_mask()
+
+    def stop(self) -> None:
+        self.stopped.set()
@@ -0,0 +1,81 @@
+"""
+Per-frame cost of the morphology stage before and after precompiling it.
+
+Run from the repository root:
+    python -m benchmarks.bench_morphology --frames 200
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from MotionDetector.morphology import MorphologyStage
+from MotionDetector.preprocessor import morphological_transformation
+
+RESOLUTION = (1920, 1080)
+
+
+def make_masks(scale: float, count: int, seed: int = 0) -> list:
+    """Binary foreground masks with a few blobs and salt noise, like a MOG2 output."""
+    rng = np.random.default_rng(seed)
+    width, height = int(RESOLUTION[0] * scale), int(RESOLUTION[1] * scale)
+    masks = []
+    for _ in range(count):
+        mask = np.where(rng.random((height, width)) > 0.98, 255, 0).astype(np.uint8)
+        for _ in range(5):
+            center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+            cv2.circle(mask, center, int(rng.integers(5, 40 * scale + 6)), 255, -1)
+        masks.append(mask)
+    return masks
+
+
+def bench_before(masks: list) -> float:
+    start = time.perf_counter()
+    for mask in masks:
+        eroded = morphological_transformation(frame=mask, morph_type=cv2.MORPH_ERODE,
+                                              morph_element=cv2.MORPH_CROSS, kernel_size=1, iterations=3)
+        morphological_transformation(frame=eroded, morph_type=cv2.MORPH_DILATE,
+                                     morph_element=cv2.MORPH_ELLIPSE, kernel_size=2, iterations=2)
+    return (time.perf_counter() - start) / len(masks)
+
+
+def bench_after(masks: list, fuse: bool = None) -> float:
+    stage = MorphologyStage(fuse=fuse)
+    eroded = np.empty_like(masks[0])
+    dilated = np.empty_like(masks[0])
+    start = time.perf_counter()
+    for mask in masks:
+        stage.apply(mask, eroded=eroded, dilated=dilated)
+    return (time.perf_counter() - start) / len(masks)
+
+
+def check_equal(masks: list) -> bool:
+    stage = MorphologyStage(fuse=True)
+    for mask in masks[:5]:
+        eroded = morphological_transformation(frame=mask, morph_type=cv2.MORPH_ERODE,
+                                              morph_element=cv2.MORPH_CROSS, kernel_size=1, iterations=3)
+        expected = morphological_transformation(frame=eroded, morph_type=cv2.MORPH_DILATE,
+                                                morph_element=cv2.MORPH_ELLIPSE, kernel_size=2, iterations=2)
+        if not np.array_equal(expected, stage.apply(mask)):
+            return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.3, 1.0])
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        masks = make_masks(scale, args.frames)
+        print(f"scale {scale}: {masks[0].shape[1]}x{masks[0].shape[0]}, fused result identical: {check_equal(masks)}")
+        print(f"  before       {bench_before(masks) * 1000:8.3f} ms/frame")
+        print(f"  after        {bench_after(masks) * 1000:8.3f} ms/frame")
+        print(f"  after fused  {bench_after(masks, fuse=True) * 1000:8.3f} ms/frame")
+        print(f"  after split  {bench_after(masks, fuse=False) * 1000:8.3f} ms/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Feed recorded or synthetic video through PreProcessor, ContourProcessor and
+MotionBuffer as fast as possible and report throughput, stage latencies,
+peak RSS and, for synthetic scenes, detection accuracy.
+
+Every configuration runs in its own process and streams its frames, so the
+reported RSS belongs to that configuration alone: 'rss_baseline_mb' is the
+peak before the first frame, 'rss_delta_mb' what the run added on top.
+Synthetic scenes run once without and once with a mask cropping the frame.
+'fps' counts the pipeline time only, generating or decoding the frames is
+reported apart as 'source_ms' per frame.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmark --output results.json
+    python -m benchmarks.run_benchmark --video ./test_data/test.avi --scales 0.3 0.5 --mask ./mask.png
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import replace
+from typing import Dict, Iterator, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+from MotionDetector.buffer_motion import MotionBuffer, MotionFlag
+from MotionDetector.contours import ContourProcessor
+from MotionDetector.metrics import Metrics
+from MotionDetector.preprocessor import PreProcessor
+from benchmarks.synthetic import SyntheticScene
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+class SampleMetrics(Metrics):
+    """Metrics keeping every sample, for exact percentiles."""
+
+    def __init__(self):
+        Metrics.__init__(self, enabled=True)
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def observe(self, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        self.samples[stage].append(now - start)
+        return now
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def read_video(file_path: str, max_frames: int) -> Iterator[np.ndarray]:
+    cap = cv2.VideoCapture(file_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video '{file_path}'.")
+    try:
+        for _ in range(max_frames):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+def read_frames(source: Union[str, SyntheticScene], max_frames: int) -> Iterator[np.ndarray]:
+    if isinstance(source, SyntheticScene):
+        # a copy starts the noise generator over, every run sees the same frames
+        return iter(replace(source))
+    return read_video(source, max_frames)
+
+
+def write_mask(scene: SyntheticScene, directory: str) -> str:
+    """Mask keeping the band the object moves through, the preprocessor crops to it."""
+    mask = np.zeros((scene.height, scene.width), dtype=np.uint8)
+    cv2.rectangle(mask, (scene.width // 10, scene.height // 8),
+                  (scene.width * 9 // 10, scene.height * 7 // 8), 255, -1)
+    file_path = os.path.join(directory, f"mask_{scene.width}x{scene.height}.png")
+    cv2.imwrite(file_path, mask)
+    return file_path
+
+
+def accuracy(truth: List[bool], detected: List[bool], intervals: List[Tuple[int, int]], starts: List[int]) -> dict:
+    truth, detected = np.array(truth), np.array(detected)
+    true_positive = int(np.sum(truth & detected))
+    precision = true_positive / max(1, int(detected.sum()))
+    recall = true_positive / max(1, int(truth.sum()))
+    # an interval counts as found if a MotionStart falls into it
+    found = sum(any(start <= index < end for index in starts) for start, end in intervals)
+    return {"frame_precision": round(precision, 4),
+            "frame_recall": round(recall, 4),
+            "events_expected": len(intervals),
+            "events_found": found,
+            "events_detected": len(starts)}
+
+
+def run(source: Union[str, SyntheticScene], mask_path: str, scale: float, args: argparse.Namespace) -> dict:
+    """One configuration, called in a fresh process."""
+    preprocessor = PreProcessor(scale=scale,
+                                sub_threshold=args.sub_threshold,
+                                mask_path=mask_path,
+                                gate_threshold=args.gate_threshold,
+                                gate_pixel_threshold=args.gate_pixel_threshold)
+    contour_processor = ContourProcessor(min_area_ratio=args.min_area_ratio,
+                                         max_area_ratio=args.max_area_ratio,
+                                         scale=scale)
+    motion_buffer = MotionBuffer(buffer_size=2)
+    metrics = SampleMetrics()
+    preprocessor.metrics = metrics
+
+    frames = read_frames(source, args.frames)
+    start = time.perf_counter()
+    first = next(frames, None)
+    source_time = time.perf_counter() - start
+    if first is None:
+        raise FileNotFoundError(f"No frames read from '{source}'.")
+    resolution = f"{first.shape[1]}x{first.shape[0]}"
+    baseline = peak_rss_mb()
+
+    detected, starts = [], []
+    frame, index, pipeline_time = first, 0, 0.0
+    while frame is not None:
+        begin = start = time.perf_counter()
+        image_item = preprocessor.preprocess_image(frame)
+        start = metrics.observe("preprocess", start)
+        contour_processor.find_contours(image_item)
+        start = metrics.observe("contours", start)
+        status = motion_buffer.get_motion(image_item.has_contours)
+        metrics.observe("motion", start)
+        if status == MotionFlag.MotionStart:
+            starts.append(index)
+        detected.append(motion_buffer.motion_flag)
+        # frame generation and decoding stay outside the pipeline time
+        start = time.perf_counter()
+        pipeline_time += start - begin
+        frame = next(frames, None)
+        source_time += time.perf_counter() - start
+        index += 1
+
+    count = index
+    peak = peak_rss_mb()
+
+    return {"scale": scale,
+            "mask": os.path.basename(mask_path) if mask_path else None,
+            "resolution": resolution,
+            "frames": count,
+            "fps": round(count / pipeline_time, 2),
+            "source_ms": round(source_time / count * 1000, 4),
+            "frames_gated": preprocessor.frames_gated,
+            "stages_ms": {stage: {f"p{q}": round(float(np.percentile(samples, q)) * 1000, 4) for q in (50, 95, 99)}
+                          for stage, samples in metrics.samples.items()},
+            "peak_rss_mb": round(peak, 1),
+            "rss_baseline_mb": round(baseline, 1),
+            "rss_delta_mb": round(peak - baseline, 1),
+            "detected": detected,
+            "starts": starts}
+
+
+def run_isolated(source: Union[str, SyntheticScene], mask_path: str, scale: float, args: argparse.Namespace) -> dict:
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1) as pool:
+        return pool.apply(run, (source, mask_path, scale, args))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", nargs="*", default=[], help="recorded clips, synthetic scenes if omitted")
+    parser.add_argument("--resolutions", nargs="+", default=["720p", "1080p"], choices=sorted(RESOLUTIONS))
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.3, 0.5, 1.0])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--sub-threshold", type=int, default=80)
+    parser.add_argument("--min-area-ratio", type=float, default=0.5)
+    parser.add_argument("--max-area-ratio", type=float, default=35.0)
+    parser.add_argument("--gate-threshold", type=float, default=None,
+                        help="fraction of changed thumbnail pixels below which a frame is skipped")
+    parser.add_argument("--gate-pixel-threshold", type=int, default=10)
+    parser.add_argument("--mask", default=None, help="mask for the recorded clips")
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    mask_dir = tempfile.mkdtemp(prefix="benchmark_masks_")
+    sources = []
+    for video in args.video:
+        sources.append((video, video, args.mask))
+    if not args.video:
+        for name in args.resolutions:
+            width, height = RESOLUTIONS[name]
+            scene = SyntheticScene(width=width, height=height, frames=args.frames,
+                                   motion_intervals=[(args.frames // 5, args.frames * 2 // 5),
+                                                     (args.frames * 3 // 5, args.frames * 4 // 5)])
+            sources.append((f"synthetic_{name}", scene, None))
+            sources.append((f"synthetic_{name}_mask", scene, write_mask(scene, mask_dir)))
+
+    results = []
+    for name, source, mask_path in sources:
+        for scale in args.scales:
+            result = run_isolated(source, mask_path, scale, args)
+            detected, starts = result.pop("detected"), result.pop("starts")
+            result["source"] = name
+            if isinstance(source, SyntheticScene):
+                result["accuracy"] = accuracy(source.ground_truth, detected, source.motion_intervals, starts)
+            results.append(result)
+            print(f"{name:>25} scale {scale:<4} {result['fps']:>9.1f} fps  "
+                  f"preprocess p95 {result['stages_ms']['preprocess']['p95']:.2f} ms  "
+                  f"source {result['source_ms']:.2f} ms/frame  "
+                  f"rss +{result['rss_delta_mb']} MB  {result.get('accuracy', '')}")
+    shutil.rmtree(mask_dir, ignore_errors=True)
+
+    if args.output:
+        report = {"commit": git_commit(),
+                  "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "platform": platform.platform(),
+                  "python": platform.python_version(),
+                  "opencv": cv2.__version__,
+                  "results": results}
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
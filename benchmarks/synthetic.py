@@ -0,0 +1,57 @@
+"""
+Synthetic scenes with known motion intervals for benchmarks and accuracy checks.
+"""
+from dataclasses import dataclass, field
+from typing import Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class SyntheticScene:
+    width: int = 1280
+    height: int = 720
+    frames: int = 300
+    motion_intervals: List[Tuple[int, int]] = field(default_factory=lambda: [(60, 120), (200, 240)])
+    object_size: float = 0.12
+    noise: float = 4.0
+    seed: int = 0
+
+    def __post_init__(self):
+        rng = np.random.default_rng(self.seed)
+        background = rng.integers(40, 200, (self.height // 16 + 1, self.width // 16 + 1, 3), dtype=np.uint8)
+        self.background = cv2.resize(background, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        self.rng = rng
+
+    def in_motion(self, index: int) -> bool:
+        return any(start <= index < end for start, end in self.motion_intervals)
+
+    @property
+    def ground_truth(self) -> List[bool]:
+        return [self.in_motion(index) for index in range(self.frames)]
+
+    def _draw_object(self, frame: np.ndarray, index: int) -> None:
+        for start, end in self.motion_intervals:
+            if start <= index < end:
+                progress = (index - start) / max(1, end - start - 1)
+                size = int(min(self.width, self.height) * self.object_size)
+                x = int(progress * (self.width - size))
+                y = int(self.height / 2 - size / 2 + np.sin(progress * 2 * np.pi) * self.height / 4)
+                cv2.rectangle(frame, (x, y), (x + size, y + size), (30, 220, 30), -1)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for index in range(self.frames):
+            frame = self.background.copy()
+            if self.noise:
+                noise = self.rng.normal(0, self.noise, frame.shape)
+                frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+            self._draw_object(frame, index)
+            yield frame
+
+    def write(self, file_path: str, fps: float = 15.0) -> str:
+        writer = cv2.VideoWriter(file_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (self.width, self.height))
+        for frame in self:
+            writer.write(frame)
+        writer.release()
+        return file_path
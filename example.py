@@ -1,6 +1,8 @@
 import cv2
+from functools import partial
 from os import path
 from MotionDetector import MotionDetector
+from MotionDetector.event_store import EventStore
 from MotionDetector.item_image import ImageItem
 import CustomLogger
 from src.lib_path import make_path
@@ -9,11 +11,13 @@ dir_log = make_path("./log/")
 dir_original = make_path("./images/raw/")
 dir_overlay = make_path("./images/overlay/")
 dir_video = make_path("./Videos/")
+event_db = path.join(make_path("./data/"), "events.db")
 
 url = "./test_data/test.avi"
 
 log = CustomLogger.getLogger(level=20,
-                             log_path=dir_log)
+                             log_path=dir_log,
+                             queued=True)
 
 
 def log_start_motion(image_item: ImageItem) -> None:
@@ -27,41 +31,37 @@ def log_end_motion(image_item: ImageItem) -> None:
     log.info("Motion ended.")
 
 
-def save_image_overlay(image_item: ImageItem) -> None:
-    file_path = path.join(dir_overlay, f"{image_item.timestamp}.jpg")
+def log_clip(image_item: ImageItem) -> None:
+    log.info(f"Recording clip to path: {image_item.clip_path}")
+
+
+def save_image_overlay(image_item: ImageItem, event_store: EventStore = None) -> None:
+    file_path = path.join(dir_overlay, f"{image_item.event_id}.jpg")
     with open(file_path, "wb") as image:
         image.write(image_item.binary_overlay)
     log.info(f"Wrote image to path: {file_path}")
+    if event_store is not None:
+        event_store.add_media(image_item.event_id, file_path)
 
 
-def save_image_original(image_item: ImageItem) -> None:
-    file_path = path.join(dir_original, f"{image_item.timestamp}.jpg")
+def save_image_original(image_item: ImageItem, event_store: EventStore = None) -> None:
+    file_path = path.join(dir_original, f"{image_item.event_id}.jpg")
     with open(file_path, "wb") as image:
         image.write(image_item.binary_image)
     log.info(f"Wrote image to path: {file_path}")
-
-
-def save_video(image_item: ImageItem) -> None:
-    file_path = path.join(dir_video, f"{image_item.timestamp}.avi")
-    fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-    fps = 0.4
-    resolution = image_item.resolution
-    writer = cv2.VideoWriter(file_path, fourcc, fps, resolution)
-    for frame in image_item.frames:
-        _ = writer.write(frame)
-    writer.release()
-    log.info(f"Wrote Video to path: {file_path}")
+    if event_store is not None:
+        event_store.add_media(image_item.event_id, file_path)
 
 
 def main(debug: bool) -> None:
     # Create Motion Detector Object
-    motion_detector = MotionDetector(url=url)
+    motion_detector = MotionDetector(url=url, record_dir=dir_video, event_db=event_db)
     # Register Functions to Eventhandler
     motion_detector.motion_start_handler.subscribe(log_start_motion)
-    motion_detector.motion_start_handler.subscribe(save_image_overlay)
-    motion_detector.motion_start_handler.subscribe(save_image_original)
+    motion_detector.motion_start_handler.subscribe(partial(save_image_overlay, event_store=motion_detector.event_store))
+    motion_detector.motion_start_handler.subscribe(partial(save_image_original, event_store=motion_detector.event_store))
+    motion_detector.motion_start_handler.subscribe(log_clip)
     motion_detector.motion_end_handler.subscribe(log_end_motion)
-    motion_detector.motion_end_handler.subscribe(save_video)
     # start Motion Detector
     motion_detector.start()
 
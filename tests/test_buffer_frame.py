@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from MotionDetector.buffer_frame import FrameBuffer
+
+
+def _frame(value: int) -> np.ndarray:
+    return np.full((2, 3, 3), value, dtype=np.uint8)
+
+
+def _values(frames) -> list:
+    return [int(frame[0, 0, 0]) for frame in frames]
+
+
+@pytest.mark.parametrize("added", [1, 3, 4, 5, 9])
+def test_snapshot_is_ordered_oldest_first(added):
+    frame_buffer = FrameBuffer(buffer_size=4)
+    for value in range(added):
+        frame_buffer.add_frame(_frame(value))
+
+    expected = list(range(max(0, added - 4), added))
+    assert _values(frame_buffer.snapshot()) == expected
+    assert _values(frame_buffer.get_frames()) == expected
+    assert _values(frame_buffer[index] for index in range(len(frame_buffer))) == expected
+    assert int(frame_buffer[-1][0, 0, 0]) == added - 1
+
+
+def test_snapshot_is_a_copy():
+    frame_buffer = FrameBuffer(buffer_size=2)
+    frame_buffer.add_frame(_frame(1))
+    frame_buffer.add_frame(_frame(2))
+
+    snapshot = frame_buffer.snapshot()
+    frame_buffer.add_frame(_frame(3))
+
+    assert _values(snapshot) == [1, 2]
+
+
+def test_commit_of_next_slot():
+    frame_buffer = FrameBuffer(buffer_size=2)
+    assert frame_buffer.next_slot() is None
+    frame_buffer.add_frame(_frame(1))
+
+    np.copyto(frame_buffer.next_slot(), _frame(2))
+    frame_buffer.commit()
+
+    assert _values(frame_buffer.snapshot()) == [1, 2]
+    assert frame_buffer.buffer_full()
+
+
+def test_new_shape_starts_over():
+    frame_buffer = FrameBuffer(buffer_size=3)
+    frame_buffer.add_frame(_frame(1))
+    frame_buffer.add_frame(np.zeros((4, 4, 3), dtype=np.uint8))
+
+    assert len(frame_buffer) == 1
+
+
+def test_empty():
+    frame_buffer = FrameBuffer(buffer_size=2)
+
+    assert len(frame_buffer.snapshot()) == 0
+    assert frame_buffer.get_frames() == []
+    with pytest.raises(IndexError):
+        frame_buffer[0]
+    with pytest.raises(ValueError):
+        FrameBuffer(buffer_size=0)
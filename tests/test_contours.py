@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+from MotionDetector.item_contours import ContourSet
+
+
+def _contours():
+    frame = np.zeros((120, 160), dtype=np.uint8)
+    cv2.rectangle(frame, (10, 10), (40, 30), 255, -1)
+    cv2.circle(frame, (100, 60), 20, 255, -1)
+    cv2.fillPoly(frame, [np.array([[60, 90], [90, 115], [50, 115]], dtype=np.int32)], 255)
+    # a single pixel has a contour of one point and no area
+    frame[5, 150] = 255
+    contours, _ = cv2.findContours(frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours, frame.size
+
+
+def test_areas_and_boxes_match_opencv():
+    contours, frame_area = _contours()
+    contour_set = ContourSet.from_contours(contours, frame_area)
+
+    assert len(contour_set) == len(contours)
+    for index, contour in enumerate(contours):
+        assert contour_set.areas[index] == cv2.contourArea(contour)
+        assert tuple(contour_set.boxes[index]) == cv2.boundingRect(contour)
+        assert contour_set.ratios[index] == round(cv2.contourArea(contour) / frame_area * 100, 1)
+
+
+def test_select_keeps_matching_rows():
+    contours, frame_area = _contours()
+    contour_set = ContourSet.from_contours(contours, frame_area, scale=0.5, offset=(3, 4))
+    keep = contour_set.areas > 0
+
+    selected = contour_set.select(keep)
+
+    assert len(selected) == int(keep.sum())
+    assert (selected.areas == contour_set.areas[keep]).all()
+    assert (selected.boxes == contour_set.boxes[keep]).all()
+    assert (selected.scale, selected.offset) == (0.5, (3, 4))
+
+
+def test_empty():
+    contour_set = ContourSet.from_contours([], 100)
+
+    assert len(contour_set) == 0
+    assert contour_set.boxes.shape == (0, 4)
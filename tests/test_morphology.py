@@ -0,0 +1,31 @@
+import cv2
+import numpy as np
+import pytest
+
+from MotionDetector.morphology import MorphologyOperation, MorphologyStage
+
+
+def _mask() -> np.ndarray:
+    random = np.random.default_rng(0)
+    mask = (random.random((90, 160)) > 0.7).astype(np.uint8) * 255
+    cv2.rectangle(mask, (20, 20), (60, 50), 255, -1)
+    return mask
+
+
+@pytest.mark.parametrize("morph_type", [cv2.MORPH_ERODE, cv2.MORPH_DILATE])
+@pytest.mark.parametrize("element", [cv2.MORPH_RECT, cv2.MORPH_CROSS, cv2.MORPH_ELLIPSE])
+@pytest.mark.parametrize("kernel_size, iterations", [(1, 1), (1, 3), (2, 2), (3, 4)])
+def test_fused_equals_iterated(morph_type, element, kernel_size, iterations):
+    fused = MorphologyOperation(morph_type, element, kernel_size, iterations, fuse=True)
+    iterated = MorphologyOperation(morph_type, element, kernel_size, iterations, fuse=False)
+    mask = _mask()
+
+    assert fused.iterations == 1
+    assert iterated.iterations == iterations
+    assert (fused.apply(mask) == iterated.apply(mask)).all()
+
+
+def test_stage_default_choice_matches_iterated():
+    mask = _mask()
+
+    assert (MorphologyStage().apply(mask) == MorphologyStage(fuse=False).apply(mask)).all()
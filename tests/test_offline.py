@@ -0,0 +1,47 @@
+from MotionDetector.offline import MotionEvent, merge_segments
+
+
+def _event(start: float, end: float, continued: bool = False, open: bool = False, ratio: float = 1.0) -> MotionEvent:
+    return MotionEvent(start=start, end=end, start_frame=int(start), end_frame=int(end),
+                       min_area_ratio=ratio, max_area_ratio=ratio, sum_area_ratio=ratio,
+                       continued=continued, open=open)
+
+
+def test_event_across_a_boundary_is_merged():
+    segments = [[_event(0, 2), _event(8, 10, open=True, ratio=1.0)],
+                [_event(10, 12, continued=True, ratio=3.0), _event(15, 16)]]
+
+    merged = merge_segments(segments)
+
+    assert [(event.start, event.end) for event in merged] == [(0, 2), (8, 12), (15, 16)]
+    assert (merged[1].start_frame, merged[1].end_frame) == (8, 12)
+    assert (merged[1].min_area_ratio, merged[1].max_area_ratio, merged[1].sum_area_ratio) == (1.0, 3.0, 4.0)
+    assert not any(event.continued or event.open for event in merged)
+
+
+def test_event_across_several_boundaries():
+    segments = [[_event(5, 10, open=True)],
+                [_event(10, 20, continued=True, open=True)],
+                [_event(20, 22, continued=True)]]
+
+    merged = merge_segments(segments)
+
+    assert [(event.start, event.end) for event in merged] == [(5, 22)]
+
+
+def test_continued_event_without_open_predecessor_is_kept():
+    # the warm-up saw motion the previous segment had already ended
+    segments = [[_event(0, 9)],
+                [_event(10, 11, continued=True)],
+                [],
+                [_event(30, 31, continued=True)]]
+
+    merged = merge_segments(segments)
+
+    assert [(event.start, event.end) for event in merged] == [(0, 9), (10, 11), (30, 31)]
+
+
+def test_open_event_at_the_end_of_the_file_stays():
+    merged = merge_segments([[_event(0, 1)], [_event(10, 12, open=True)]])
+
+    assert [(event.start, event.end) for event in merged] == [(0, 1), (10, 12)]
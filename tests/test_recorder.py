@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from MotionDetector import recorder as recorder_module
+from MotionDetector.buffer_frame import FrameBuffer
+from MotionDetector.buffer_motion import MotionFlag
+from MotionDetector.item_image import ImageItem
+from MotionDetector.recorder import ClipRecorder
+
+
+class FakeWriter:
+    def __init__(self, file_path, fourcc, fps, size, is_color):
+        self.file_path = file_path
+        self.size = size
+        self.frames = []
+        self.released = False
+        WRITERS.append(self)
+
+    def write(self, frame):
+        self.frames.append(int(frame[0, 0, 0]))
+
+    def release(self):
+        self.released = True
+
+
+WRITERS = []
+
+
+@pytest.fixture
+def writers(monkeypatch):
+    WRITERS.clear()
+    monkeypatch.setattr(recorder_module.cv2, "VideoWriter", FakeWriter)
+    return WRITERS
+
+
+def _frame(value: int) -> np.ndarray:
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+
+def _feed(recorder: ClipRecorder, frame_buffer: FrameBuffer, statuses, first_value: int = 0) -> list:
+    items = []
+    for value, status in enumerate(statuses, start=first_value):
+        frame = frame_buffer.add_frame(_frame(value))
+        item = ImageItem(has_data=True, motion_status=status, original_frame=frame, event_id=f"event{value}")
+        recorder.update(item, frame_buffer)
+        items.append(item)
+    return items
+
+
+def _messages(recorder: ClipRecorder) -> list:
+    messages = []
+    while not recorder.input_queue.empty():
+        messages.append(recorder.input_queue.get_nowait()[0])
+    return messages
+
+
+def test_clip_with_pre_roll_and_post_roll(tmp_path, writers):
+    recorder = ClipRecorder(directory=str(tmp_path), name="cam", post_roll=2)
+    frame_buffer = FrameBuffer(buffer_size=3)
+    recorder.start()
+
+    statuses = [MotionFlag.NoMotion, MotionFlag.NoMotion, MotionFlag.MotionStart, MotionFlag.MotionOngoing,
+                MotionFlag.MotionEnd, MotionFlag.NoMotion, MotionFlag.NoMotion, MotionFlag.NoMotion,
+                MotionFlag.NoMotion]
+    items = _feed(recorder, frame_buffer, statuses)
+    recorder.stop(timeout=5)
+
+    assert len(writers) == 1
+    writer = writers[0]
+    assert writer.file_path == str(tmp_path / "cam_event2.avi")
+    assert writer.size == (6, 4)
+    # the buffered frames up to the start, the event and two frames of post-roll
+    assert writer.frames == [0, 1, 2, 3, 4, 5, 6]
+    assert writer.released
+    assert items[2].clip_path == writer.file_path
+    assert not recorder.recording
+
+
+def test_motion_start_while_recording_extends_the_clip(tmp_path):
+    recorder = ClipRecorder(directory=str(tmp_path), post_roll=1)
+    frame_buffer = FrameBuffer(buffer_size=2)
+
+    _feed(recorder, frame_buffer, [MotionFlag.MotionStart, MotionFlag.MotionEnd, MotionFlag.MotionStart,
+                                   MotionFlag.MotionEnd, MotionFlag.NoMotion, MotionFlag.NoMotion])
+
+    assert _messages(recorder) == ["open", "frame", "frame", "frame", "frame", "close"]
+    assert not recorder.recording
+
+
+def test_full_queue_skips_the_clip(tmp_path):
+    recorder = ClipRecorder(directory=str(tmp_path), max_queue=1)
+    frame_buffer = FrameBuffer(buffer_size=2)
+    recorder.input_queue.put_nowait(("frame", _frame(0)))
+
+    items = _feed(recorder, frame_buffer, [MotionFlag.MotionStart, MotionFlag.MotionOngoing])
+
+    assert recorder.skipped_clips == 1
+    assert not recorder.recording
+    assert items[0].clip_path == ""
+
+
+def test_full_queue_drops_frames_and_retries_the_close(tmp_path):
+    recorder = ClipRecorder(directory=str(tmp_path), post_roll=0, max_queue=2)
+    frame_buffer = FrameBuffer(buffer_size=2)
+
+    _feed(recorder, frame_buffer, [MotionFlag.MotionStart, MotionFlag.MotionOngoing, MotionFlag.MotionOngoing])
+    assert recorder.dropped_frames == 1
+
+    _feed(recorder, frame_buffer, [MotionFlag.NoMotion], first_value=3)
+    assert recorder.close_pending
+    assert recorder.stalls == 1
+
+    assert _messages(recorder) == ["open", "frame"]
+    _feed(recorder, frame_buffer, [MotionFlag.NoMotion], first_value=4)
+    assert not recorder.close_pending
+    assert _messages(recorder) == ["close"]